@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+
+def gaussian_pdf(points, mus, Sigmas, dtype=np.float32, chunk_size=1 << 16):
+    """
+    Evaluates the densities of K multivariate Gaussians at every one of a set of points:
+
+        pdf(x) = exp(-0.5 * |L^-1 (x - mu)|^2) / ((2 pi)^(d / 2) * det(L))
+
+    where L is the Cholesky factor of Sigma. Each covariance is factored once, up front, rather
+    than once per evaluation, and the points are processed `chunk_size` at a time in `dtype`, so
+    that evaluating many Gaussians over a large grid needs neither a new distribution object per
+    Gaussian nor a (K, points, d) temporary for the whole grid at once.
+
+    As with `scipy.stats.multivariate_normal`, only the lower triangle of each covariance is read.
+
+    @param points - an array of shape (..., d), e.g. a (900, 900, 2) grid of points.
+    @param mus - a (d,) mean, or a (K, d) stack of them (column vectors of shape (d, 1) or
+           (K, d, 1) are accepted as well).
+    @param Sigmas - a (d, d) covariance, or a (K, d, d) stack of them.
+    @param dtype - floating point type to evaluate and return the densities in.
+    @param chunk_size - number of points to evaluate at once.
+
+    @returns an array of shape (...) for a single Gaussian, or (K, ...) for a stack of them.
+    """
+    points = np.asarray(points)
+    d = points.shape[-1]
+
+    Sigmas = np.asarray(Sigmas, dtype=np.float64)
+    single = Sigmas.ndim == 2
+    Sigmas = Sigmas.reshape((-1, d, d))
+    mus = np.asarray(mus, dtype=np.float64).reshape((len(Sigmas), d))
+
+    # Factor each covariance once, and fold everything that does not depend on the points into a
+    # per-Gaussian normalization constant.
+    L = np.linalg.cholesky(Sigmas)
+    L_inv = np.linalg.inv(L).astype(dtype)
+    log_norm = -np.log(np.diagonal(L, axis1=-2, axis2=-1)).sum(axis=-1) - 0.5 * d * np.log(
+        2 * np.pi
+    )
+    log_norm = log_norm.astype(dtype)
+    mus = mus.astype(dtype)
+
+    flat_points = points.reshape((-1, d))
+    densities = np.empty((len(Sigmas), len(flat_points)), dtype=dtype)
+    for start in range(0, len(flat_points), chunk_size):
+        chunk = flat_points[start : start + chunk_size].astype(dtype, copy=False)
+
+        # (K, chunk, d) whitened offsets of every point from every mean
+        whitened = (chunk[np.newaxis] - mus[:, np.newaxis]) @ np.swapaxes(L_inv, -1, -2)
+        mahalanobis = np.einsum("kni,kni->kn", whitened, whitened)
+
+        densities[:, start : start + chunk_size] = np.exp(
+            log_norm[:, np.newaxis] - 0.5 * mahalanobis
+        )
+
+    densities = densities.reshape((len(Sigmas),) + points.shape[:-1])
+    return densities[0] if single else densities
+
+
+def gaussian_pdf_grid(X, Y, mus, Sigmas, dtype=np.float32, chunk_size=1 << 16):
+    """
+    Evaluates 2D Gaussians over the grid given by `X` and `Y` (e.g. from `np.mgrid`), see
+    `gaussian_pdf`.
+
+    @returns an array with the shape of `X` for a single Gaussian, or (K,) + X.shape for a stack
+             of them.
+    """
+    points = np.stack((X, Y), axis=-1)
+    return gaussian_pdf(points, mus, Sigmas, dtype, chunk_size)
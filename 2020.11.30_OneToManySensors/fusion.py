@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+from collections import namedtuple
+import heapq
+import itertools
+
+import numpy as np
+
+
+Sensor = namedtuple("Sensor", ["H", "R"])
+Measurement = namedtuple("Measurement", ["time", "sensor", "z", "tracks"])
+
+
+def fuse_measurements(zs, Rs):
+    """
+    Combines several measurements of the same quantity (i.e. sharing an observation matrix H) into
+    a single equivalent measurement, by adding them up in information form:
+
+        R_fused^-1 = sum(R_i^-1)
+        z_fused = R_fused @ sum(R_i^-1 @ z_i)
+
+    One Kalman update with (z_fused, R_fused) gives exactly the same result as updating with each
+    measurement in turn, but needs a single gain computation instead of one per measurement.
+
+    @param zs - a sequence of (T, k, 1) stacks of measurements.
+    @param Rs - a sequence of (k, k) measurement noise covariances, one per measurement.
+
+    @returns (z_fused, R_fused)
+    """
+    information = np.linalg.inv(np.stack(Rs))
+    R_fused = np.linalg.inv(information.sum(axis=0))
+
+    weighted = sum(R_inv @ z for (R_inv, z) in zip(information, zs))
+    return (R_fused @ weighted, R_fused)
+
+
+class FusionScheduler:
+    """
+    Feeds timestamped measurements from many sensors into a `KalmanFilterBank`.
+
+    Measurements are queued as they arrive and applied in time order once they are older than
+    `latency`, which gives slower sensors time to report before the filter moves past them.
+    Measurements that still arrive after the filter has moved on are handled by rolling the filter
+    back to a checkpoint taken before their timestamp and replaying everything since.
+
+    Measurements that fall within `time_resolution` of each other are applied together. Those from
+    sensors that share an observation matrix (and cover the same tracks) are first combined with
+    `fuse_measurements`, so a tick with dozens of similar sensors costs one update instead of
+    dozens.
+    """
+
+    def __init__(self, bank, transition, time=0.0, latency=0.0, time_resolution=0.0, history=64):
+        """
+        @param bank - the `KalmanFilterBank` to update.
+        @param transition - a callable `transition(delta_t)` returning the (F, Q) used to predict
+               the bank forwards by `delta_t`.
+        @param time - the time that the current state of `bank` refers to.
+        @param latency - how long to hold on to measurements before applying them.
+        @param time_resolution - measurements closer together than this are applied as one step.
+        @param history - number of checkpoints to keep for rolling back out-of-order measurements.
+        """
+        self.bank = bank
+        self.transition = transition
+        self.time = time
+        self.latency = latency
+        self.time_resolution = time_resolution
+        self.history = history
+
+        self.sensors = {}
+        self._pending = []
+        self._sequence = itertools.count()
+        # (time of the step, filter time before the step, bank snapshot, measurements of the step)
+        self._checkpoints = []
+
+    def add_sensor(self, name, H, R):
+        """
+        Registers a sensor with its (k, n) observation matrix and (k, k) measurement noise.
+        """
+        self.sensors[name] = Sensor(
+            np.asarray(H, dtype=np.float64), np.asarray(R, dtype=np.float64)
+        )
+
+    def add_measurement(self, time, sensor, z, tracks=None):
+        """
+        Queues a measurement from a registered sensor.
+
+        @param time - when the measurement was taken.
+        @param sensor - name of the sensor, see `add_sensor`.
+        @param z - a (len(tracks), k, 1) stack of measurements.
+        @param tracks - optional indices of the tracks that were measured. Defaults to every track.
+        """
+        if sensor not in self.sensors:
+            raise KeyError(f'Unknown sensor "{sensor}".')
+        if tracks is not None:
+            tracks = tuple(int(track) for track in tracks)
+
+        if time < self.time:
+            self._rollback(time)
+
+        measurement = Measurement(time, sensor, np.asarray(z), tracks)
+        heapq.heappush(self._pending, (time, next(self._sequence), measurement))
+
+    def advance(self, now):
+        """
+        Applies, in time order, every queued measurement taken at least `latency` before `now`.
+
+        @returns the number of measurements applied.
+        """
+        applied = 0
+        cutoff = now - self.latency
+        while self._pending and self._pending[0][0] <= cutoff:
+            first = heapq.heappop(self._pending)[2]
+            step = [first]
+            while (
+                self._pending
+                and self._pending[0][0] <= cutoff
+                and self._pending[0][0] - first.time <= self.time_resolution
+            ):
+                step.append(heapq.heappop(self._pending)[2])
+
+            self._apply(first.time, step)
+            applied += len(step)
+        return applied
+
+    def _apply(self, time, step):
+        self._checkpoints.append((time, self.time, self.bank.snapshot(), step))
+        if len(self._checkpoints) > self.history:
+            self._checkpoints.pop(0)
+
+        if time > self.time:
+            (F, Q) = self.transition(time - self.time)
+            self.bank.predict(F, Q)
+            self.time = time
+
+        # Group the measurements of this step by the sensor geometry they share
+        groups = {}
+        for measurement in step:
+            sensor = self.sensors[measurement.sensor]
+            key = (sensor.H.shape, sensor.H.tobytes(), measurement.tracks)
+            groups.setdefault(key, []).append(measurement)
+
+        for measurements in groups.values():
+            sensors = [self.sensors[measurement.sensor] for measurement in measurements]
+            tracks = measurements[0].tracks
+            tracks = None if tracks is None else list(tracks)
+
+            if len(measurements) == 1:
+                (z, R) = (measurements[0].z, sensors[0].R)
+            else:
+                (z, R) = fuse_measurements(
+                    [measurement.z for measurement in measurements],
+                    [sensor.R for sensor in sensors],
+                )
+            self.bank.update(z, sensors[0].H, R, tracks)
+
+    def _rollback(self, time):
+        # Undo every step at or after `time`, and queue its measurements up again, so that they
+        # are replayed in order along with the late measurement.
+        restored = None
+        while self._checkpoints and self._checkpoints[-1][0] >= time:
+            restored = self._checkpoints.pop()
+            for measurement in restored[3]:
+                heapq.heappush(self._pending, (measurement.time, next(self._sequence), measurement))
+
+        if restored is not None:
+            (_, self.time, snapshot, _) = restored
+            self.bank.restore(snapshot)
+
+        if time < self.time:
+            raise ValueError(
+                f"A measurement at {time} is older than the filter can roll back to ({self.time})."
+            )
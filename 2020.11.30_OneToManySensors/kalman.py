@@ -0,0 +1,457 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+
+def motion_model(delta_t, process_noise=((0.2, 0.0), (0.0, 0.4))):
+    """
+    The (position, velocity) model used by `predict()` in oneToManySensors.py, with an
+    acceleration as the control input:
+
+        F = [[1 delta_t]      B = [[delta_t^2 / 2]
+             [0       1]]          [delta_t      ]]
+
+    @param delta_t - time step, either a scalar or a (T,) array with one time step per track.
+    @param process_noise - the (2, 2) process noise Q, or a (T, 2, 2) stack of them.
+
+    @returns (F, B, Q) - with shapes (2, 2), (2, 1) and (2, 2) for a scalar `delta_t`, or
+             (T, 2, 2), (T, 2, 1) and (T, 2, 2) for an array of time steps.
+    """
+    delta_t = np.asarray(delta_t, dtype=np.float64)
+    ones = np.ones_like(delta_t)
+    zeros = np.zeros_like(delta_t)
+
+    F = np.stack((np.stack((ones, delta_t), -1), np.stack((zeros, ones), -1)), -2)
+    B = np.stack(((delta_t**2) / 2, delta_t), -1)[..., np.newaxis]
+    Q = np.broadcast_to(np.asarray(process_noise, dtype=np.float64), F.shape)
+    return (F, B, Q)
+
+
+def _predict_mean(mu, F, B, u):
+    mu_pred = F @ mu
+    if B is not None and u is not None:
+        mu_pred = mu_pred + B @ (np.asarray(u) * np.ones((B.shape[-1], 1)))
+    return mu_pred.astype(mu.dtype, copy=False)
+
+
+def predict(mu, Sigma, F, Q, B=None, u=None):
+    """
+    Advances a stack of T tracks by one step:
+
+        mu_pred = F @ mu + B @ u
+        Sigma_pred = F @ Sigma @ F^T + Q
+
+    Any of `F`, `Q`, `B` and `u` can either be shared by every track (e.g. an (n, n) `F`) or given
+    per track (e.g. a (T, n, n) `F`); numpy broadcasting takes care of the rest.
+
+    @param mu - a (T, n, 1) stack of state vectors.
+    @param Sigma - a (T, n, n) stack of state covariances.
+    @param F - the state transition matrix.
+    @param Q - the process noise covariance.
+    @param B - optional control matrix, (n, m) or (T, n, m).
+    @param u - optional control input, a scalar, (m, 1) or (T, m, 1).
+
+    @returns (mu_pred, Sigma_pred) - with the same shapes as `mu` and `Sigma`.
+    """
+    mu_pred = _predict_mean(mu, F, B, u)
+    Sigma_pred = F @ Sigma @ np.swapaxes(F, -1, -2) + Q
+    return (mu_pred, Sigma_pred)
+
+
+def update(mu, Sigma, z, H, R, form="joseph"):
+    """
+    Incorporates one measurement per track into a stack of T tracks:
+
+        S = H @ Sigma @ H^T + R
+        K = Sigma @ H^T @ S^-1
+        mu_final = mu + K @ (z - H @ mu)
+
+    As in oneToManySensors.py, the gain comes from solving a linear system rather than inverting
+    S, here as one stacked `np.linalg.solve` for every track at once.
+
+    The covariance can be updated in one of two forms:
+
+        "standard": Sigma_final = (I - K @ H) @ Sigma
+        "joseph":   Sigma_final = (I - K @ H) @ Sigma @ (I - K @ H)^T + K @ R @ K^T
+
+    Both are equal in exact arithmetic, but the standard form subtracts two nearly equal matrices
+    and can lose symmetry and positive definiteness to rounding error (especially in float32),
+    whereas the Joseph form is a sum of two positive semi-definite terms and keeps them.
+
+    @param mu - a (T, n, 1) stack of predicted state vectors.
+    @param Sigma - a (T, n, n) stack of predicted state covariances.
+    @param z - a (T, k, 1) stack of measurements.
+    @param H - the (k, n) or (T, k, n) observation matrix.
+    @param R - the (k, k) or (T, k, k) measurement noise covariance.
+    @param form - "joseph" or "standard".
+
+    @returns (mu_final, Sigma_final) - with the same shapes as `mu` and `Sigma`.
+    """
+    if form not in ("joseph", "standard"):
+        raise ValueError(f'Unknown update form "{form}".')
+
+    HT = np.swapaxes(H, -1, -2)
+    S = H @ Sigma @ HT + R
+
+    # S @ K^T = H @ Sigma, since both S and Sigma are symmetric
+    K = np.swapaxes(np.linalg.solve(S, H @ Sigma), -1, -2)
+
+    mu_final = mu + K @ (z - H @ mu)
+
+    I_KH = np.identity(Sigma.shape[-1], dtype=Sigma.dtype) - K @ H
+    if form == "standard":
+        Sigma_final = I_KH @ Sigma
+    else:
+        Sigma_final = I_KH @ Sigma @ np.swapaxes(I_KH, -1, -2)
+        Sigma_final += K @ R @ np.swapaxes(K, -1, -2)
+    return (mu_final, Sigma_final)
+
+
+def _lower_triangular_factor(pre_array):
+    # Triangularizes a stack of (rows x columns) pre-arrays, i.e. finds lower-triangular L with
+    # L @ L^T = pre_array @ pre_array^T, from the QR decomposition of the transposed pre-array.
+    # The signs are fixed up so that L has a positive diagonal, like a Cholesky factor.
+    r = np.linalg.qr(np.swapaxes(pre_array, -1, -2), mode="r")
+    L = np.swapaxes(r, -1, -2)
+    signs = np.sign(np.diagonal(L, axis1=-2, axis2=-1)).copy()
+    signs[signs == 0] = 1
+    return L * signs[..., np.newaxis, :]
+
+
+def covariance_factor(Sigma):
+    """
+    A lower-triangular factor L of each covariance, with Sigma = L @ L^T, for the square-root
+    form.
+
+    This is the Cholesky factor when Sigma is positive definite. Cholesky rejects covariances that
+    are only positive semi-definite, such as the rank-deficient white-acceleration noise
+    Q = G @ G^T, zero process noise, or a state component that is known exactly. Those are
+    factored from their eigendecomposition instead, with eigenvalues that rounding pushed below
+    zero clipped to zero, and then triangularized.
+
+    @param Sigma - an (n, n) covariance or a (T, n, n) stack of them.
+
+    @returns an array of lower-triangular factors with the shape of Sigma.
+    """
+    Sigma = np.asarray(Sigma, dtype=np.float64)
+    try:
+        return np.linalg.cholesky(Sigma)
+    except np.linalg.LinAlgError:
+        (eigenvalues, eigenvectors) = np.linalg.eigh(Sigma)
+        factor = eigenvectors * np.sqrt(np.maximum(eigenvalues, 0.0))[..., np.newaxis, :]
+        return _lower_triangular_factor(factor)
+
+
+def sqrt_predict(mu, L, F, Q_sqrt, B=None, u=None):
+    """
+    The square-root form of `predict`, which propagates a Cholesky factor L of each covariance
+    (Sigma = L @ L^T) instead of the covariance itself:
+
+        [F @ L, Q_sqrt] -> triangularize -> L_pred
+
+    Covariances rebuilt from a factor are positive semi-definite by construction, and the factor
+    only needs half the dynamic range of the covariance, which is what lets a filter run in
+    float32 for long periods without diverging.
+
+    @param L - a (T, n, n) stack of lower-triangular factors of the covariances.
+    @param Q_sqrt - a factor of the process noise, (n, n) or (T, n, n), e.g. from
+           `covariance_factor`.
+
+    @returns (mu_pred, L_pred) - see `predict` for everything else.
+    """
+    F = np.asarray(F, dtype=L.dtype)
+    mu_pred = _predict_mean(mu, F, B, u)
+
+    FL = F @ L
+    pre_array = np.concatenate((FL, np.broadcast_to(Q_sqrt, FL.shape).astype(L.dtype)), axis=-1)
+    return (mu_pred, _lower_triangular_factor(pre_array))
+
+
+def sqrt_update(mu, L, z, H, R_sqrt):
+    """
+    The square-root form of `update`. The whole update is a single triangularization of the
+    pre-array
+
+        [[R_sqrt  H @ L]        [[S_sqrt  0     ]
+         [0       L    ]]  ->    [K_bar   L_final]]
+
+    after which K = K_bar @ S_sqrt^-1, so the innovation is whitened with a triangular solve and
+    the gain never has to be formed explicitly.
+
+    @param L - a (T, n, n) stack of lower-triangular factors of the covariances.
+    @param R_sqrt - a factor of the measurement noise, (k, k) or (T, k, k), e.g. from
+           `covariance_factor`.
+
+    @returns (mu_final, L_final) - see `update` for everything else.
+    """
+    H = np.asarray(H, dtype=L.dtype)
+    HL = H @ L
+    (batch, k, n) = HL.shape
+    R_sqrt = np.broadcast_to(R_sqrt, (batch, k, k)).astype(L.dtype)
+
+    top = np.concatenate((R_sqrt, HL), axis=-1)
+    bottom = np.concatenate((np.zeros((batch, n, k), dtype=L.dtype), L), axis=-1)
+    post_array = _lower_triangular_factor(np.concatenate((top, bottom), axis=-2))
+
+    S_sqrt = post_array[..., :k, :k]
+    K_bar = post_array[..., k:, :k]
+    L_final = post_array[..., k:, k:]
+
+    mu_final = mu + K_bar @ np.linalg.solve(S_sqrt, z - H @ mu).astype(mu.dtype)
+    return (mu_final, L_final)
+
+
+class KalmanFilterBank:
+    """
+    Tracks T independent objects with Kalman filters that are stepped together. The states of
+    every track are stored as stacked (T, n, 1) and (T, n, n) arrays, so that predicting or
+    updating all of them is a handful of batched matrix operations rather than a Python loop per
+    track.
+
+    The covariances can be kept in one of three forms, see `update` and `sqrt_update`:
+
+        "joseph":      full covariances, updated with the Joseph form (the default).
+        "standard":    full covariances, updated with (I - K @ H) @ Sigma.
+        "square-root": Cholesky factors of the covariances (see `covariance_factor`, which also
+                       takes positive semi-definite ones). This is the most robust form, and the
+                       one to use with float32 state.
+    """
+
+    def __init__(self, mu, Sigma, form="joseph", dtype=np.float64):
+        """
+        @param mu - a (T, n, 1) stack of initial state vectors.
+        @param Sigma - a (T, n, n) stack of initial state covariances.
+        @param form - "joseph", "standard" or "square-root".
+        @param dtype - floating point type to keep the state in.
+        """
+        if form not in ("joseph", "standard", "square-root"):
+            raise ValueError(f'Unknown form "{form}".')
+        self.form = form
+
+        self.mu = np.array(mu, dtype=dtype)
+        Sigma = np.array(Sigma, dtype=np.float64)
+        if self.mu.ndim != 3 or Sigma.shape != self.mu.shape[:2] + self.mu.shape[1:2]:
+            raise ValueError(
+                f"Expected (T, n, 1) and (T, n, n) arrays, got {self.mu.shape} and {Sigma.shape}."
+            )
+
+        if form == "square-root":
+            self.L = covariance_factor(Sigma).astype(dtype)
+        else:
+            self._Sigma = Sigma.astype(dtype)
+
+    def __len__(self):
+        return len(self.mu)
+
+    def snapshot(self):
+        """
+        @returns a copy of the state of every track, for `restore`.
+        """
+        if self.form == "square-root":
+            return (self.mu.copy(), self.L.copy())
+        return (self.mu.copy(), self._Sigma.copy())
+
+    def restore(self, snapshot):
+        """
+        Resets the state of every track to a `snapshot` taken from this filter bank earlier.
+        """
+        (mu, covariance) = snapshot
+        self.mu = mu.copy()
+        if self.form == "square-root":
+            self.L = covariance.copy()
+        else:
+            self._Sigma = covariance.copy()
+
+    @property
+    def Sigma(self):
+        """
+        The (T, n, n) state covariances. In square-root form these are rebuilt from their factors
+        on every access.
+        """
+        if self.form == "square-root":
+            return self.L @ np.swapaxes(self.L, -1, -2)
+        return self._Sigma
+
+    def predict(self, F, Q, B=None, u=None):
+        """
+        Advances every track by one step, see `predict`.
+        """
+        if self.form == "square-root":
+            Q_sqrt = covariance_factor(Q)
+            (self.mu, self.L) = sqrt_predict(self.mu, self.L, F, Q_sqrt, B, u)
+        else:
+            (self.mu, self._Sigma) = predict(self.mu, self._Sigma, F, Q, B, u)
+            self._Sigma = self._Sigma.astype(self.mu.dtype, copy=False)
+
+    def update(self, z, H, R, tracks=None):
+        """
+        Incorporates measurements into the filter, see `update`.
+
+        @param z - a (len(tracks), k, 1) stack of measurements.
+        @param H - the (k, n) or (len(tracks), k, n) observation matrix.
+        @param R - the (k, k) or (len(tracks), k, k) measurement noise covariance.
+        @param tracks - optional indices of the tracks that the measurements belong to, when not
+               every track was observed this step. Defaults to every track.
+        """
+        if tracks is None:
+            tracks = slice(None)
+
+        if self.form == "square-root":
+            R_sqrt = covariance_factor(R)
+            (self.mu[tracks], self.L[tracks]) = sqrt_update(
+                self.mu[tracks], self.L[tracks], z, H, R_sqrt
+            )
+        else:
+            (self.mu[tracks], self._Sigma[tracks]) = update(
+                self.mu[tracks], self._Sigma[tracks], z, H, R, self.form
+            )
+
+
+def information_predict(y, Y, F, Q, B=None, u=None):
+    """
+    The information-form counterpart of `predict`, for filters that keep the information matrix
+    Y = Sigma^-1 and information vector y = Sigma^-1 @ mu instead of mu and Sigma.
+
+    The process noise is additive in covariance form, not in information form, so this steps
+    through covariance form: recover mu and Sigma, `predict`, and convert back. That costs two
+    stacked (n x n) inversions per track, independent of how many sensors feed the filter.
+
+    @param y - a (T, n, 1) stack of information vectors.
+    @param Y - a (T, n, n) stack of information matrices.
+
+    @returns (y_pred, Y_pred) - see `predict` for everything else.
+    """
+    Sigma = np.linalg.inv(Y)
+    mu = Sigma @ y
+
+    (mu_pred, Sigma_pred) = predict(mu, Sigma, F, Q, B, u)
+
+    Y_pred = np.linalg.inv(Sigma_pred)
+    return (Y_pred @ mu_pred, Y_pred)
+
+
+def information_update(y, Y, zs, Hs, Rs):
+    """
+    The information-form counterpart of `update`, for any number of sensors at once. Each sensor
+    simply adds its contribution to the information vector and matrix:
+
+        y_final = y + sum(H_i^T @ R_i^-1 @ z_i)
+        Y_final = Y + sum(H_i^T @ R_i^-1 @ H_i)
+
+    so there is no gain to compute, and sensors with the same measurement size are summed as one
+    stacked operation.
+
+    @param y - a (T, n, 1) stack of information vectors.
+    @param Y - a (T, n, n) stack of information matrices.
+    @param zs - a sequence with one (T, k_i, 1) stack of measurements per sensor.
+    @param Hs - a sequence with the (k_i, n) observation matrix of each sensor.
+    @param Rs - a sequence with the (k_i, k_i) measurement noise covariance of each sensor.
+
+    @returns (y_final, Y_final) - with the same shapes as `y` and `Y`.
+    """
+    if not len(zs) == len(Hs) == len(Rs):
+        raise ValueError("Expected one observation matrix and noise covariance per measurement.")
+
+    # Sensors with the same measurement size can be stacked together
+    groups = {}
+    for (z, H, R) in zip(zs, Hs, Rs):
+        groups.setdefault(np.shape(R), []).append((z, H, R))
+
+    y_final = y.copy()
+    Y_final = Y.copy()
+    for group in groups.values():
+        (z, H, R) = (np.stack(parts) for parts in zip(*group))
+
+        # H_i^T @ R_i^-1 for every sensor i in the group
+        HT_R_inv = np.swapaxes(np.linalg.solve(R, H), -1, -2)
+
+        y_final += np.einsum("snk,stkc->tnc", HT_R_inv, z)
+        Y_final += (HT_R_inv @ H).sum(axis=0)
+    return (y_final, Y_final)
+
+
+class InformationFilterBank:
+    """
+    A `KalmanFilterBank` that keeps its tracks in information form, i.e. as information vectors
+    y = Sigma^-1 @ mu and information matrices Y = Sigma^-1. Updates from many sensors in the same
+    tick then become sums (see `information_update`), which is cheaper than one gain solve per
+    sensor when dozens of sensors report at once.
+
+    It has the same interface as `KalmanFilterBank`, so the two can be used interchangeably (e.g.
+    with `fusion.FusionScheduler`).
+    """
+
+    def __init__(self, mu, Sigma, dtype=np.float64):
+        """
+        @param mu - a (T, n, 1) stack of initial state vectors.
+        @param Sigma - a (T, n, n) stack of initial state covariances.
+        @param dtype - floating point type to keep the state in.
+        """
+        mu = np.array(mu, dtype=np.float64)
+        Sigma = np.array(Sigma, dtype=np.float64)
+        if mu.ndim != 3 or Sigma.shape != mu.shape[:2] + mu.shape[1:2]:
+            raise ValueError(
+                f"Expected (T, n, 1) and (T, n, n) arrays, got {mu.shape} and {Sigma.shape}."
+            )
+
+        self.Y = np.linalg.inv(Sigma).astype(dtype)
+        self.y = (self.Y @ mu.astype(dtype)).astype(dtype)
+
+    def __len__(self):
+        return len(self.y)
+
+    @property
+    def mu(self):
+        """
+        The (T, n, 1) state vectors, recovered from the information form on every access.
+        """
+        return np.linalg.solve(self.Y, self.y)
+
+    @property
+    def Sigma(self):
+        """
+        The (T, n, n) state covariances, recovered from the information form on every access.
+        """
+        return np.linalg.inv(self.Y)
+
+    def snapshot(self):
+        """
+        @returns a copy of the state of every track, for `restore`.
+        """
+        return (self.y.copy(), self.Y.copy())
+
+    def restore(self, snapshot):
+        """
+        Resets the state of every track to a `snapshot` taken from this filter bank earlier.
+        """
+        (y, Y) = snapshot
+        self.y = y.copy()
+        self.Y = Y.copy()
+
+    def predict(self, F, Q, B=None, u=None):
+        """
+        Advances every track by one step, see `information_predict`.
+        """
+        (y, Y) = information_predict(self.y, self.Y, F, Q, B, u)
+        self.y = y.astype(self.y.dtype, copy=False)
+        self.Y = Y.astype(self.Y.dtype, copy=False)
+
+    def update(self, z, H, R, tracks=None):
+        """
+        Incorporates measurements from a single sensor, see `KalmanFilterBank.update`.
+        """
+        self.update_many([z], [H], [R], tracks)
+
+    def update_many(self, zs, Hs, Rs, tracks=None):
+        """
+        Incorporates measurements from any number of sensors at once, see `information_update`.
+
+        @param tracks - optional indices of the tracks that every one of the measurements belongs
+               to. Defaults to every track.
+        """
+        if tracks is None:
+            tracks = slice(None)
+
+        (self.y[tracks], self.Y[tracks]) = information_update(
+            self.y[tracks], self.Y[tracks], zs, Hs, Rs
+        )
@@ -9,14 +9,12 @@ from matplotlib import gridspec
 import matplotlib.pylab as pl
 from matplotlib.colors import ListedColormap
 import numpy as np
-from scipy.stats import multivariate_normal
+
+from densities import gaussian_pdf_grid
 
 
 def multivariate_gaussian(X, Y, mu, Sigma):
-    pos = np.empty(X.shape + (2,))
-    pos[:, :, 0] = X
-    pos[:, :, 1] = Y
-    return multivariate_normal(mu, Sigma).pdf(pos)
+    return gaussian_pdf_grid(X, Y, mu, Sigma)
 
 
 def plot_gaussian(X1, Y1, mu, Sigma, cmap):
@@ -168,13 +166,13 @@ def main():
 
     # Factor out the Sigma_pred from each side, and you get:
     Sigma_fac = np.identity(2) - (K @ H)
-    Sigma_final = Sigma_fac @ Sigma_pred
 
-    # This is a tricky step. For some updates, Sigma_final can lose its
-    # positive semi-definite property. There are elegant mathematical ways to go around this
-    # (see https://en.wikipedia.org/wiki/Kalman_filter#Square_root_form for instance)
-    # but we're going to take the easy way out here.
-    Sigma_final[Sigma_final < 0] = 0
+    # This is a tricky step. Computed directly as Sigma_fac @ Sigma_pred, Sigma_final can lose
+    # its positive semi-definite property to rounding error. The Joseph form below is equal in
+    # exact arithmetic, but is a sum of two positive semi-definite terms, so it keeps that property
+    # (see https://en.wikipedia.org/wiki/Kalman_filter#Deriving_the_posteriori_estimate_covariance_matrix
+    # and the square-root form in kalman.py for an even more robust alternative).
+    Sigma_final = Sigma_fac @ Sigma_pred @ Sigma_fac.T + K @ R_t @ K.T
     print(f"\nmu_add: \n{mu_add},\nmu_pred:\n{mu_pred},\nmu_final: \n{mu_final}")
     print(f"Sigma_pred:\n{Sigma_pred},\nSigma_final: \n{Sigma_final}")
 
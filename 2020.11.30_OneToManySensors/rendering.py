@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+import matplotlib.image
+from matplotlib import gridspec
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+import numpy as np
+
+from densities import gaussian_pdf_grid
+
+
+def surface_quads(X, Y, Z):
+    """
+    Builds the quadrilaterals of a surface over a grid, like `plot_surface` does, but for all cells
+    at once.
+
+    @returns an (M, 4, 3) array of quad corners, and the (M,) mean height of every quad.
+    """
+    corners = np.stack(
+        (
+            np.stack((X[:-1, :-1], Y[:-1, :-1], Z[:-1, :-1]), axis=-1),
+            np.stack((X[1:, :-1], Y[1:, :-1], Z[1:, :-1]), axis=-1),
+            np.stack((X[1:, 1:], Y[1:, 1:], Z[1:, 1:]), axis=-1),
+            np.stack((X[:-1, 1:], Y[:-1, 1:], Z[:-1, 1:]), axis=-1),
+        ),
+        axis=-2,
+    ).reshape((-1, 4, 3))
+    return (corners, corners[..., 2].mean(axis=-1))
+
+
+class BeliefRenderer:
+    """
+    Renders Gaussian beliefs over a fixed grid the way `plot_gaussian` and `add_gaussian` do (a
+    surface plot next to a filled contour plot), but headless and for many frames.
+
+    The figure, its axes and one surface per layer are created once. Every frame then only swaps in
+    the new surface heights and colours and redraws the filled contours, which avoids the figure
+    construction and layout that dominate the cost of calling `plot_gaussian` in a loop.
+    """
+
+    def __init__(self, X, Y, cmaps, stride=3, figsize=(16, 8), dpi=50):
+        """
+        @param X, Y - the grid to evaluate the Gaussians over, e.g. from `np.mgrid`.
+        @param cmaps - one colormap per layer, i.e. per Gaussian drawn in each frame.
+        @param stride - plot every `stride`-th row and column of the grid in the surface plot, as
+               with the `rstride` and `cstride` arguments of `plot_surface`.
+        @param figsize, dpi - the size of the frames, in inches and dots per inch.
+        """
+        self.X = X
+        self.Y = Y
+        self.cmaps = list(cmaps)
+        self.stride = stride
+        (self._X, self._Y) = (X[::stride, ::stride], Y[::stride, ::stride])
+
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        gs = gridspec.GridSpec(1, 2, width_ratios=[2, 2], figure=self.figure)
+
+        self.ax = self.figure.add_subplot(gs[0], projection="3d")
+        flat = np.zeros_like(self._X)
+        self.surfaces = []
+        for cmap in self.cmaps:
+            (quads, heights) = surface_quads(self._X, self._Y, flat)
+            surface = Poly3DCollection(quads, cmap=cmap, linewidth=1, antialiased=True)
+            surface.set_array(heights)
+            self.ax.add_collection3d(surface)
+            self.surfaces.append(surface)
+
+        max_range = np.array([X.max() - X.min(), Y.max() - Y.min()]).max() / 2.0
+        mid_x = (X.max() + X.min()) * 0.5
+        mid_y = (Y.max() + Y.min()) * 0.5
+        self.ax.set_xlim(mid_x - max_range, mid_x + max_range)
+        self.ax.set_ylim(mid_y - max_range, mid_y + max_range)
+        self.ax.set_xlabel("position")
+        self.ax.set_ylabel("velocity")
+        self.ax.view_init(25, 290)
+
+        self.ax2 = self.figure.add_subplot(gs[1])
+        self.ax2.set_xlim(X.min(), X.max())
+        self.ax2.set_ylim(Y.min(), Y.max())
+        self.ax2.set_aspect("equal")
+        self.ax2.grid("true")
+        self.ax2.set_xlabel("position")
+        self.ax2.set_ylabel("velocity")
+        self.contours = []
+
+        self.figure.tight_layout()
+
+    def draw(self, Zs):
+        """
+        Draws one frame from precomputed surfaces.
+
+        @param Zs - one array with the shape of the grid per layer.
+
+        @returns the frame, as a (height, width, 4) RGBA array of uint8. The array is a view of
+                 the canvas, so it is only valid until the next frame is drawn.
+        """
+        if len(Zs) != len(self.surfaces):
+            raise ValueError(f"Expected {len(self.surfaces)} layers, got {len(Zs)}.")
+
+        z_max = 0.0
+        for (surface, Z) in zip(self.surfaces, Zs):
+            (quads, heights) = surface_quads(self._X, self._Y, Z[:: self.stride, :: self.stride])
+            surface.set_verts(quads)
+            surface.set_array(heights)
+            surface.norm.autoscale(heights)
+            z_max = max(z_max, float(Z.max()))
+        self.ax.set_zlim(0.0, z_max if z_max > 0.0 else 1.0)
+
+        for contour in self.contours:
+            contour.remove()
+        self.contours = [
+            self.ax2.contourf(self.X, self.Y, Z, cmap=cmap) for (Z, cmap) in zip(Zs, self.cmaps)
+        ]
+
+        self.canvas.draw()
+        return np.asarray(self.canvas.buffer_rgba())
+
+    def render(self, mus, Sigmas):
+        """
+        Draws one frame with a Gaussian belief per layer, see `draw`.
+
+        @param mus - a (K, 2) or (K, 2, 1) stack of means, one per layer, or a single (2,) or
+                     (2, 1) mean for a single layer.
+        @param Sigmas - a (K, 2, 2) stack of covariances, one per layer, or a single (2, 2)
+                        covariance for a single layer.
+        """
+        # A single Gaussian is a stack of one, so that it still makes one layer
+        Sigmas = np.asarray(Sigmas)
+        if Sigmas.ndim == 2:
+            Sigmas = Sigmas[np.newaxis]
+        mus = np.asarray(mus).reshape(len(Sigmas), 2)
+        return self.draw(gaussian_pdf_grid(self.X, self.Y, mus, Sigmas))
+
+
+class PngSink:
+    """
+    Writes every frame to its own PNG file.
+    """
+
+    def __init__(self, pattern="frame_{:05d}.png"):
+        """
+        @param pattern - file name of the frames, formatted with the index of each frame.
+        """
+        self.pattern = pattern
+        self.frames = 0
+
+    def write(self, frame):
+        matplotlib.image.imsave(self.pattern.format(self.frames), frame)
+        self.frames += 1
+
+    def close(self):
+        pass
+
+
+class RawVideoSink:
+    """
+    Writes frames back to back as raw RGBA bytes, e.g. into the stdin of
+
+        ffmpeg -f rawvideo -pix_fmt rgba -s <width>x<height> -r 30 -i - belief.mp4
+    """
+
+    def __init__(self, stream):
+        """
+        @param stream - a binary file object, or the path of a file to create.
+        """
+        self._owned = isinstance(stream, str)
+        self.stream = open(stream, "wb") if self._owned else stream
+        self.frames = 0
+
+    def write(self, frame):
+        self.stream.write(np.ascontiguousarray(frame).data)
+        self.frames += 1
+
+    def close(self):
+        if self._owned:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+
+def render_frames(renderer, beliefs, sink):
+    """
+    Renders a sequence of beliefs with `renderer`, writing every frame to `sink`.
+
+    @param renderer - a `BeliefRenderer`.
+    @param beliefs - an iterable of (mus, Sigmas) pairs, one per frame, see
+           `BeliefRenderer.render`.
+    @param sink - where to write the frames, e.g. a `PngSink` or a `RawVideoSink`.
+
+    @returns the number of frames written.
+    """
+    frames = 0
+    try:
+        for (mus, Sigmas) in beliefs:
+            sink.write(renderer.render(mus, Sigmas))
+            frames += 1
+    finally:
+        sink.close()
+    return frames
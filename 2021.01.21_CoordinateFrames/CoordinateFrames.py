@@ -263,7 +263,7 @@ def transform_as_gamma_matrix(sx, sy, theta, tx, ty, x_A, y_A):
     scale (sx, sy) factors, by formulating the transformation according to:
 
     Gamma = [[sx*cos(theta)  -sx*sin(theta)  tx],
-             [sy*sin(theta)   sy*sin(theta)  ty],
+             [sy*sin(theta)   sy*cos(theta)  ty],
              [            0               0   1]]
 
     Inputs:
@@ -277,6 +277,8 @@ def transform_as_gamma_matrix(sx, sy, theta, tx, ty, x_A, y_A):
     Returns:
 
     A tuple (x_B, y_B) representing the transformed point
+
+    See `Transform2D` in transforms.py to transform whole arrays of points at once.
     """
     theta_in_radians = theta / 180 * np.pi
 
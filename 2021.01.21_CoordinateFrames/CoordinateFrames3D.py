@@ -311,6 +311,8 @@ def transform_as_separate_operations(sx, sy, sz, omega, phi, kappa, tx, ty, tz,
     Returns:
 
     A tuple (x_B, y_B, z_B) representing the transformed point
+
+    See `Transform3D` in transforms.py to transform whole point clouds at once.
     """
     w = omega * np.pi / 180
     p = phi * np.pi / 180
@@ -350,7 +352,7 @@ def transform_as_separate_operations(sx, sy, sz, omega, phi, kappa, tx, ty, tz,
         ]
     )
 
-    translation = np.array([tx, ty])
+    translation = np.array([tx, ty, tz])
 
     p_A = np.array([x_A, y_A, z_A])
 
@@ -366,7 +368,7 @@ def transform_as_gamma_matrix(sx, sy, sz, omega, phi, kappa, tx, ty, tz, x_A, y_
 
     Gamma = [[sx*rxx  sx*rxy  sx*rxz tx],
              [sy*ryx  sy*ryy  sy*ryz ty],
-             [sz*rzx  sz*rzy  sz*rzz ty],
+             [sz*rzx  sz*rzy  sz*rzz tz],
              [     0       0       0  1]]
 
     We stick to using the ZYX formulation here. First rotate X, then Y, then Z. This is consistent
@@ -383,6 +385,8 @@ def transform_as_gamma_matrix(sx, sy, sz, omega, phi, kappa, tx, ty, tz, x_A, y_
     Returns:
 
     A tuple (x_B, y_B, z_B) representing the transformed point
+
+    See `Transform3D` in transforms.py to transform whole point clouds at once.
     """
     w = omega * np.pi / 180
     p = phi * np.pi / 180
@@ -424,7 +428,7 @@ def transform_as_gamma_matrix(sx, sy, sz, omega, phi, kappa, tx, ty, tz, x_A, y_
 
     Gamma = np.zeros((4, 4))
     Gamma[0:3, 0:3] = S @ R
-    Gamma[3, 0:3] = [tx, ty, tz]
+    Gamma[0:3, 3] = [tx, ty, tz]
     Gamma[3, 3] = 1
 
     p_A = np.array([x_A, y_A, z_A, 1])
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+class FrameGraph:
+    """
+    A tree of named coordinate frames, e.g. a world frame W with a vehicle frame under it and
+    sensor frames A and B under that, connected by the Gamma matrices between each frame and its
+    parent.
+
+    `transform(A, B)` answers "what is the Gamma matrix from A to B" by composing the edges along
+    the path between the two frames. Composed matrices are cached: every frame keeps its Gamma
+    matrix to (and from) the root of its tree, and every answered query is kept as well. When an
+    edge changes, only the cached matrices of the frames below that edge are dropped, so updating
+    one sensor's extrinsics does not force every other chain to be composed again.
+
+    The graph works in 2D, with the (3, 3) Gamma matrices of CoordinateFrames.py, or in 3D, with the
+    (4, 4) ones of CoordinateFrames3D.py and transforms.py.
+    """
+
+    def __init__(self, dimension=3):
+        """
+        Inputs:
+
+        dimension - 2 or 3, the number of spatial dimensions of the frames
+        """
+        self.dimension = dimension
+        self._parents = {}
+        self._children = {}
+        # Gamma matrix from each frame to its parent
+        self._edges = {}
+
+        # Caches: frame -> Gamma to / from the root of its tree, and (source, target) -> Gamma
+        self._to_root = {}
+        self._from_root = {}
+        self._queries = {}
+        self._queries_by_frame = {}
+
+    def __contains__(self, name):
+        return name in self._parents
+
+    def _as_gamma(self, Gamma):
+        Gamma = np.array(Gamma, dtype=np.float64)
+        size = self.dimension + 1
+        if Gamma.shape != (size, size):
+            raise ValueError(f"Expected a ({size}, {size}) Gamma matrix, got {Gamma.shape}.")
+        return Gamma
+
+    def _check(self, name):
+        if name not in self._parents:
+            raise KeyError(f'Unknown frame "{name}".')
+
+    def add_frame(self, name, parent=None, Gamma=None):
+        """
+        Adds a frame to the graph.
+
+        Inputs:
+
+        name   - Name of the new frame
+        parent - Name of the frame it is attached to, or None for the root of a new tree
+        Gamma  - Gamma matrix taking points in the new frame to its parent frame. Required unless
+                 the frame is a root.
+        """
+        if name in self._parents:
+            raise ValueError(f'Frame "{name}" already exists.')
+        if parent is not None:
+            self._check(parent)
+            if Gamma is None:
+                raise ValueError(f'Frame "{name}" needs a Gamma matrix to its parent "{parent}".')
+            self._edges[name] = self._as_gamma(Gamma)
+            self._children[parent].append(name)
+
+        self._parents[name] = parent
+        self._children[name] = []
+        self._queries_by_frame[name] = set()
+
+    def set_transform(self, name, Gamma):
+        """
+        Replaces the Gamma matrix from a frame to its parent, e.g. after recalibrating a sensor,
+        and drops the cached transforms of that frame and everything below it.
+        """
+        self._check(name)
+        if self._parents[name] is None:
+            raise ValueError(f'Frame "{name}" is a root, and has no transform to a parent.')
+
+        self._edges[name] = self._as_gamma(Gamma)
+        self._invalidate(name)
+
+    def parent(self, name):
+        self._check(name)
+        return self._parents[name]
+
+    def root(self, name):
+        self._check(name)
+        while self._parents[name] is not None:
+            name = self._parents[name]
+        return name
+
+    def subtree(self, name):
+        """
+        Returns the names of a frame and of every frame below it.
+        """
+        self._check(name)
+        frames = [name]
+        for frame in frames:
+            frames.extend(self._children[frame])
+        return frames
+
+    def _invalidate(self, name):
+        for frame in self.subtree(name):
+            self._to_root.pop(frame, None)
+            self._from_root.pop(frame, None)
+            for query in self._queries_by_frame[frame]:
+                self._queries.pop(query, None)
+            self._queries_by_frame[frame].clear()
+
+    def to_root(self, name):
+        """
+        Returns the Gamma matrix taking points in a frame to the root of its tree (read-only, as
+        for `transform`).
+        """
+        self._check(name)
+        # Walk up to the closest frame with a cached (or trivial) transform, then compose back down
+        # the path, caching the result for every frame along the way.
+        path = []
+        frame = name
+        while frame not in self._to_root and self._parents[frame] is not None:
+            path.append(frame)
+            frame = self._parents[frame]
+        if frame not in self._to_root:
+            self._to_root[frame] = _read_only(np.identity(self.dimension + 1))
+
+        Gamma = self._to_root[frame]
+        for frame in reversed(path):
+            Gamma = _read_only(Gamma @ self._edges[frame])
+            self._to_root[frame] = Gamma
+        return Gamma
+
+    def _root_to(self, name):
+        if name not in self._from_root:
+            self._from_root[name] = _read_only(np.linalg.inv(self.to_root(name)))
+        return self._from_root[name]
+
+    def transform(self, source, target):
+        """
+        Returns the Gamma matrix taking points in the `source` frame to the `target` frame.
+
+        The returned matrix is cached, and so is read-only; copy it before modifying it.
+        """
+        self._check(source)
+        self._check(target)
+
+        key = (source, target)
+        if key in self._queries:
+            return self._queries[key]
+
+        if self.root(source) != self.root(target):
+            raise ValueError(f'Frames "{source}" and "{target}" are not connected.')
+        if source == target:
+            Gamma = np.identity(self.dimension + 1)
+        else:
+            Gamma = self._root_to(target) @ self.to_root(source)
+
+        self._queries[key] = _read_only(Gamma)
+        self._queries_by_frame[source].add(key)
+        self._queries_by_frame[target].add(key)
+        return Gamma
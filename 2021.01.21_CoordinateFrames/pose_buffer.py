@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from quaternions import matrices_from_quaternions, quaternions_from_matrices, slerp
+
+
+class PoseBuffer:
+    """
+    A fixed-capacity history of the timestamped poses of one moving frame, e.g. a vehicle frame
+    relative to the world frame W.
+
+    Poses are kept as unit quaternions and translations in preallocated arrays used as a ring
+    buffer, so once the buffer is full every new pose overwrites the oldest one. Poses can be
+    looked up for many timestamps at once, e.g. one per point of a rolling-shutter LiDAR sweep:
+    each lookup is a binary search over the buffer, followed by SLERP between the neighbouring
+    rotations and linear interpolation between the neighbouring translations.
+    """
+
+    def __init__(self, capacity):
+        """
+        Inputs:
+
+        capacity - The number of poses to keep
+        """
+        self.capacity = capacity
+        self._times = np.empty(capacity)
+        self._quaternions = np.empty((capacity, 4))
+        self._translations = np.empty((capacity, 3))
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def time_range(self):
+        """
+        The (oldest, newest) timestamps in the buffer.
+        """
+        if self._size == 0:
+            raise ValueError("The buffer is empty.")
+        return (
+            self._times[self._start],
+            self._times[(self._start + self._size - 1) % self.capacity],
+        )
+
+    def push(self, time, quaternion, translation):
+        """
+        Adds the pose of the frame at `time`, which must be later than every pose already in the
+        buffer.
+
+        Inputs:
+
+        time        - Timestamp of the pose
+        quaternion  - The rotation of the pose, as a unit quaternion (w, x, y, z)
+        translation - The translation (tx, ty, tz) of the pose
+        """
+        if self._size > 0 and time <= self.time_range[1]:
+            raise ValueError(
+                f"Poses must be added in time order, but {time} is not after {self.time_range[1]}."
+            )
+
+        if self._size < self.capacity:
+            index = (self._start + self._size) % self.capacity
+            self._size += 1
+        else:
+            index = self._start
+            self._start = (self._start + 1) % self.capacity
+
+        self._times[index] = time
+        self._quaternions[index] = quaternion
+        self._translations[index] = translation
+
+    def push_gamma(self, time, Gamma):
+        """
+        Adds the pose of the frame at `time`, given as a rigid (4, 4) Gamma matrix.
+        """
+        Gamma = np.asarray(Gamma, dtype=np.float64)
+        self.push(time, quaternions_from_matrices(Gamma[0:3, 0:3]), Gamma[0:3, 3])
+
+    def _search(self, times):
+        # The buffer holds at most two sorted runs: [start, capacity) followed by [0, end). Search
+        # both in place instead of unrolling the ring into a sorted copy.
+        first = self._times[self._start : min(self._start + self._size, self.capacity)]
+        second = self._times[: self._size - len(first)]
+
+        indices = np.searchsorted(first, times, side="right") - 1
+        if len(second) > 0:
+            in_second = times >= second[0]
+            indices[in_second] = (
+                len(first) + np.searchsorted(second, times[in_second], side="right") - 1
+            )
+        # Look up the newest pose as the end of the last interval
+        return np.clip(indices, 0, max(self._size - 2, 0))
+
+    def lookup(self, times):
+        """
+        Interpolates the pose of the frame at each of `times`.
+
+        Inputs:
+
+        times - An array of timestamps of any shape, all within `time_range`
+
+        Returns:
+
+        A tuple (quaternions, translations) of arrays of shape times.shape + (4,) and
+        times.shape + (3,)
+        """
+        times = np.asarray(times, dtype=np.float64)
+        (oldest, newest) = self.time_range
+        if np.any(times < oldest) or np.any(times > newest):
+            raise ValueError(f"Timestamps must be within the buffered range [{oldest}, {newest}].")
+
+        flat_times = times.reshape(-1)
+        before = self._search(flat_times)
+        i0 = (self._start + before) % self.capacity
+        i1 = (self._start + np.minimum(before + 1, self._size - 1)) % self.capacity
+
+        (t0, t1) = (self._times[i0], self._times[i1])
+        span = np.where(t1 > t0, t1 - t0, 1.0)
+        fractions = (flat_times - t0) / span
+
+        quaternions = slerp(self._quaternions[i0], self._quaternions[i1], fractions)
+        translations = self._translations[i0] + fractions[:, np.newaxis] * (
+            self._translations[i1] - self._translations[i0]
+        )
+        return (quaternions.reshape(times.shape + (4,)), translations.reshape(times.shape + (3,)))
+
+    def lookup_gamma(self, times):
+        """
+        Interpolates the pose of the frame at each of `times`, see `lookup`.
+
+        Returns:
+
+        An array of rigid Gamma matrices, of shape times.shape + (4, 4)
+        """
+        (quaternions, translations) = self.lookup(times)
+        Gamma = np.zeros(translations.shape[:-1] + (4, 4))
+        Gamma[..., 0:3, 0:3] = matrices_from_quaternions(quaternions)
+        Gamma[..., 0:3, 3] = translations
+        Gamma[..., 3, 3] = 1
+        return Gamma
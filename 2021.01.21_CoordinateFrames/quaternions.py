@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+
+def matrices_from_quaternions(q):
+    """
+    Converts unit quaternions (w, x, y, z) to rotation matrices.
+
+    Inputs:
+
+    q - An array of shape (..., 4)
+
+    Returns:
+
+    An array of shape (..., 3, 3)
+    """
+    q = np.asarray(q, dtype=np.float64)
+    (w, x, y, z) = (q[..., 0], q[..., 1], q[..., 2], q[..., 3])
+
+    R = np.empty(q.shape[:-1] + (3, 3))
+    R[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    R[..., 0, 1] = 2 * (x * y - w * z)
+    R[..., 0, 2] = 2 * (x * z + w * y)
+    R[..., 1, 0] = 2 * (x * y + w * z)
+    R[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    R[..., 1, 2] = 2 * (y * z - w * x)
+    R[..., 2, 0] = 2 * (x * z - w * y)
+    R[..., 2, 1] = 2 * (y * z + w * x)
+    R[..., 2, 2] = 1 - 2 * (x * x + y * y)
+    return R
+
+
+def quaternions_from_matrices(R):
+    """
+    Converts rotation matrices to unit quaternions (w, x, y, z), with w >= 0.
+
+    Each column of the symmetric matrix
+
+    K = [[1 + rxx + ryy + rzz          rzy - ryz          rxz - rzx          ryx - rxy]
+         [         rzy - ryz  1 + rxx - ryy - rzz          rxy + ryx          rxz + rzx]
+         [         rxz - rzx          rxy + ryx  1 - rxx + ryy - rzz          ryz + rzy]
+         [         ryx - rxy          rxz + rzx          ryz + rzy  1 - rxx - ryy + rzz]]
+
+    is a multiple of the quaternion. Taking the column with the largest diagonal entry keeps the
+    conversion accurate for every rotation, including those close to 180 degrees.
+
+    Inputs:
+
+    R - An array of shape (..., 3, 3)
+
+    Returns:
+
+    An array of shape (..., 4)
+    """
+    R = np.asarray(R, dtype=np.float64)
+    (rxx, rxy, rxz) = (R[..., 0, 0], R[..., 0, 1], R[..., 0, 2])
+    (ryx, ryy, ryz) = (R[..., 1, 0], R[..., 1, 1], R[..., 1, 2])
+    (rzx, rzy, rzz) = (R[..., 2, 0], R[..., 2, 1], R[..., 2, 2])
+
+    K = np.stack(
+        (
+            np.stack((1 + rxx + ryy + rzz, rzy - ryz, rxz - rzx, ryx - rxy), axis=-1),
+            np.stack((rzy - ryz, 1 + rxx - ryy - rzz, rxy + ryx, rxz + rzx), axis=-1),
+            np.stack((rxz - rzx, rxy + ryx, 1 - rxx + ryy - rzz, ryz + rzy), axis=-1),
+            np.stack((ryx - rxy, rxz + rzx, ryz + rzy, 1 - rxx - ryy + rzz), axis=-1),
+        ),
+        axis=-2,
+    )
+    column = np.argmax(np.diagonal(K, axis1=-2, axis2=-1), axis=-1)
+    q = np.take_along_axis(K, column[..., np.newaxis, np.newaxis], axis=-2)[..., 0, :]
+    q /= np.linalg.norm(q, axis=-1, keepdims=True)
+    return np.where(q[..., :1] < 0, -q, q)
+
+
+def slerp(q0, q1, t):
+    """
+    Spherical linear interpolation between unit quaternions, along the shorter of the two arcs
+    between them.
+
+    Inputs:
+
+    q0, q1 - Arrays of shape (..., 4)
+    t      - Interpolation fractions of shape (...), 0 for q0 and 1 for q1
+
+    Returns:
+
+    An array of shape (..., 4)
+    """
+    q0 = np.asarray(q0, dtype=np.float64)
+    q1 = np.asarray(q1, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)[..., np.newaxis]
+
+    # q and -q are the same rotation; flip q1 onto the same hemisphere as q0 to take the short way
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    q1 = np.where(dot < 0, -q1, q1)
+    dot = np.minimum(np.abs(dot), 1.0)
+
+    theta = np.arccos(dot)
+    sin_theta = np.sin(theta)
+    # For nearly identical rotations sin(theta) vanishes; plain linear interpolation is exact
+    # enough there.
+    close = sin_theta < 1e-8
+    safe_sin_theta = np.where(close, 1.0, sin_theta)
+    w0 = np.where(close, 1 - t, np.sin((1 - t) * theta) / safe_sin_theta)
+    w1 = np.where(close, t, np.sin(t * theta) / safe_sin_theta)
+
+    q = w0 * q0 + w1 * q1
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+
+def multiply(q0, q1):
+    """
+    The Hamilton product q0 * q1 of quaternions (w, x, y, z), i.e. the rotation q1 followed by q0.
+
+    Inputs:
+
+    q0, q1 - Arrays of shape (..., 4), broadcast against each other
+
+    Returns:
+
+    An array of shape (..., 4)
+    """
+    q0 = np.asarray(q0, dtype=np.float64)
+    q1 = np.asarray(q1, dtype=np.float64)
+    (w0, x0, y0, z0) = (q0[..., 0], q0[..., 1], q0[..., 2], q0[..., 3])
+    (w1, x1, y1, z1) = (q1[..., 0], q1[..., 1], q1[..., 2], q1[..., 3])
+    return np.stack(
+        (
+            w0 * w1 - x0 * x1 - y0 * y1 - z0 * z1,
+            w0 * x1 + x0 * w1 + y0 * z1 - z0 * y1,
+            w0 * y1 - x0 * z1 + y0 * w1 + z0 * x1,
+            w0 * z1 + x0 * y1 - y0 * x1 + z0 * w1,
+        ),
+        axis=-1,
+    )
+
+
+def quaternions_from_euler(omega, phi, kappa):
+    """
+    Converts rotations (counter-clockwise positive, in degrees) about the x, y and z axes to unit
+    quaternions, with the same convention as `rotation_matrices` in transforms.py: first rotate
+    about X, then Y, then Z, i.e. q = qz * qy * qx.
+
+    Returns:
+
+    An array of shape (..., 4)
+    """
+    (w, p, k) = np.broadcast_arrays(
+        *(np.radians(np.asarray(angle, dtype=np.float64)) / 2 for angle in (omega, phi, kappa))
+    )
+    (cw, sw) = (np.cos(w), np.sin(w))
+    (cp, sp) = (np.cos(p), np.sin(p))
+    (ck, sk) = (np.cos(k), np.sin(k))
+    return np.stack(
+        (
+            ck * cp * cw + sk * sp * sw,
+            ck * cp * sw - sk * sp * cw,
+            ck * sp * cw + sk * cp * sw,
+            sk * cp * cw - ck * sp * sw,
+        ),
+        axis=-1,
+    )
+
+
+def quaternions_from_rotation_vectors(v):
+    """
+    Converts rotation vectors (the rotation axis, scaled by the rotation angle in radians) to unit
+    quaternions.
+
+    Inputs:
+
+    v - An array of shape (..., 3)
+
+    Returns:
+
+    An array of shape (..., 4)
+    """
+    v = np.asarray(v, dtype=np.float64)
+    angle = np.linalg.norm(v, axis=-1, keepdims=True)
+    # sin(angle / 2) / angle, using its Taylor series close to 0
+    small = angle < 1e-6
+    safe_angle = np.where(small, 1.0, angle)
+    scale = np.where(small, 0.5 - angle**2 / 48, np.sin(safe_angle / 2) / safe_angle)
+    return np.concatenate((np.cos(angle / 2), scale * v), axis=-1)
+
+
+def rotation_vectors_from_quaternions(q):
+    """
+    Converts unit quaternions to rotation vectors, with angles in [0, pi].
+
+    Inputs:
+
+    q - An array of shape (..., 4)
+
+    Returns:
+
+    An array of shape (..., 3)
+    """
+    q = np.asarray(q, dtype=np.float64)
+    q = np.where(q[..., :1] < 0, -q, q)
+    sin_half = np.linalg.norm(q[..., 1:], axis=-1, keepdims=True)
+    angle = 2 * np.arctan2(sin_half, q[..., :1])
+    # angle / sin(angle / 2), using its Taylor series close to 0
+    small = sin_half < 1e-6
+    safe_sin_half = np.where(small, 1.0, sin_half)
+    scale = np.where(small, 2 + angle**2 / 12, angle / safe_sin_half)
+    return scale * q[..., 1:]
+
+
+def rotate(q, points):
+    """
+    Rotates points by unit quaternions, without building rotation matrices:
+
+    p' = p + 2w (u x p) + 2 u x (u x p)
+
+    where q = (w, u). This is cheaper than a matrix when every point has its own rotation; for one
+    rotation applied to many points, a single matrix product is faster (see `Rotation.apply`).
+
+    Inputs:
+
+    q      - An array of shape (..., 4)
+    points - An array of shape (..., 3), broadcast against `q`
+
+    Returns:
+
+    An array of shape (..., 3)
+    """
+    q = np.asarray(q, dtype=np.float64)
+    (w, u) = (q[..., :1], q[..., 1:])
+    uxp = np.cross(u, points)
+    return points + 2 * (w * uxp + np.cross(u, uxp))
+
+
+class Rotation:
+    """
+    A 3D rotation, or a stack of them, stored as unit quaternions of shape (..., 4).
+
+    Rotations compose, invert, interpolate and rotate points directly in quaternion form: four
+    numbers per rotation instead of nine, and 16 multiplications to compose two of them instead of
+    27. Rotation matrices are only built when asked for (or when one rotation is applied to a
+    large point cloud, where a matrix product is faster), and are then kept.
+    """
+
+    def __init__(self, quaternions):
+        """
+        Inputs:
+
+        quaternions - An array of unit quaternions (w, x, y, z), of shape (..., 4)
+        """
+        self.quaternions = np.asarray(quaternions, dtype=np.float64)
+        self._matrices = None
+
+    @classmethod
+    def identity(cls, shape=()):
+        quaternions = np.zeros(tuple(shape) + (4,))
+        quaternions[..., 0] = 1
+        return cls(quaternions)
+
+    @classmethod
+    def from_euler(cls, omega, phi, kappa):
+        """
+        From rotations in degrees about the x, y and z axes, see `quaternions_from_euler`.
+        """
+        return cls(quaternions_from_euler(omega, phi, kappa))
+
+    @classmethod
+    def from_rotation_vectors(cls, v):
+        return cls(quaternions_from_rotation_vectors(v))
+
+    @classmethod
+    def from_matrices(cls, R):
+        rotation = cls(quaternions_from_matrices(R))
+        rotation._matrices = np.asarray(R, dtype=np.float64)
+        return rotation
+
+    @property
+    def shape(self):
+        return self.quaternions.shape[:-1]
+
+    @property
+    def matrices(self):
+        """
+        The rotation matrices, of shape (..., 3, 3), built on first use.
+        """
+        if self._matrices is None:
+            self._matrices = matrices_from_quaternions(self.quaternions)
+        return self._matrices
+
+    def as_rotation_vectors(self):
+        return rotation_vectors_from_quaternions(self.quaternions)
+
+    def __getitem__(self, index):
+        return Rotation(self.quaternions[index])
+
+    def __len__(self):
+        return len(self.quaternions)
+
+    def compose(self, other):
+        """
+        Composes two rotations, so that `self.compose(other).apply(p)` is equal to
+        `self.apply(other.apply(p))`.
+        """
+        return Rotation(multiply(self.quaternions, other.quaternions))
+
+    def __matmul__(self, other):
+        return self.compose(other)
+
+    def inverse(self):
+        conjugate = self.quaternions * np.array([1.0, -1.0, -1.0, -1.0])
+        return Rotation(conjugate)
+
+    def apply(self, points):
+        """
+        Rotates points.
+
+        Inputs:
+
+        points - An (N, 3) point cloud rotated by a single rotation, or an array of shape
+                 (..., 3) broadcast against a stack of rotations
+
+        Returns:
+
+        The rotated points
+        """
+        points = np.asarray(points)
+        if self.shape == () and points.ndim == 2:
+            # Floating point points keep their precision, others are rotated in float64, as in
+            # `HomogeneousTransform.apply`
+            floating = np.issubdtype(points.dtype, np.floating)
+            dtype = points.dtype if floating else np.dtype(np.float64)
+            return points @ self.matrices.T.astype(dtype, copy=False)
+        return rotate(self.quaternions, points)
+
+    def interpolate(self, other, t):
+        """
+        Interpolates between two rotations (or stacks of them) with SLERP, see `slerp`.
+        """
+        return Rotation(slerp(self.quaternions, other.quaternions, t))
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+
+def rotation_matrices(omega, phi, kappa):
+    """
+    Builds the rotation matrices R = Rz @ Ry @ Rx used in CoordinateFrames3D.py (first rotate about
+    X, then Y, then Z), for any number of angles at once:
+
+    R = [[ck*cp  ck*sp*sw - sk*cw  ck*sp*cw + sk*sw]
+         [sk*cp  sk*sp*sw + ck*cw  sk*sp*cw - ck*sw]
+         [  -sp             cp*sw             cp*cw]]
+
+    where cw = cos(omega), sp = sin(phi), and so on. The product is written out directly, so it
+    takes six trig evaluations per rotation and no matrix products.
+
+    Inputs:
+
+    omega, phi, kappa - Rotation (counter-clockwise positive) in degrees about the x, y and z axes.
+                        Scalars or arrays of any (broadcastable) shape.
+
+    Returns:
+
+    An array of shape (..., 3, 3) with one rotation matrix per set of angles
+    """
+    (w, p, k) = np.broadcast_arrays(
+        *(np.radians(np.asarray(angle, dtype=np.float64)) for angle in (omega, phi, kappa))
+    )
+    (cw, sw) = (np.cos(w), np.sin(w))
+    (cp, sp) = (np.cos(p), np.sin(p))
+    (ck, sk) = (np.cos(k), np.sin(k))
+
+    R = np.empty(w.shape + (3, 3))
+    R[..., 0, 0] = ck * cp
+    R[..., 0, 1] = ck * sp * sw - sk * cw
+    R[..., 0, 2] = ck * sp * cw + sk * sw
+    R[..., 1, 0] = sk * cp
+    R[..., 1, 1] = sk * sp * sw + ck * cw
+    R[..., 1, 2] = sk * sp * cw - ck * sw
+    R[..., 2, 0] = -sp
+    R[..., 2, 1] = cp * sw
+    R[..., 2, 2] = cp * cw
+    return R
+
+
+def gamma_matrices_2d(scales, thetas, translations):
+    """
+    Builds the Gamma matrices of CoordinateFrames.py for any number of frames at once:
+
+    Gamma = [[sx*cos(theta)  -sx*sin(theta)  tx],
+             [sy*sin(theta)   sy*cos(theta)  ty],
+             [            0               0   1]]
+
+    Inputs:
+
+    scales       - (..., 2) scale factors (sx, sy)
+    thetas       - (...) rotations (counter-clockwise positive) in degrees
+    translations - (..., 2) translations (tx, ty)
+
+    Returns:
+
+    An array of shape (..., 3, 3), broadcast over the leading dimensions of the inputs
+    """
+    scales = np.asarray(scales, dtype=np.float64)
+    thetas = np.radians(np.asarray(thetas, dtype=np.float64))
+    translations = np.asarray(translations, dtype=np.float64)
+    (sx, sy) = (scales[..., 0], scales[..., 1])
+    (c, s) = (np.cos(thetas), np.sin(thetas))
+    shape = np.broadcast_shapes(sx.shape, c.shape, translations.shape[:-1])
+
+    Gamma = np.zeros(shape + (3, 3))
+    Gamma[..., 0, 0] = sx * c
+    Gamma[..., 0, 1] = -sx * s
+    Gamma[..., 1, 0] = sy * s
+    Gamma[..., 1, 1] = sy * c
+    Gamma[..., 0:2, 2] = translations
+    Gamma[..., 2, 2] = 1
+    return Gamma
+
+
+def gamma_matrices(scales, rotations, translations):
+    """
+    Builds the Gamma matrices of CoordinateFrames3D.py for any number of frames at once:
+
+    Gamma = [[sx*rxx  sx*rxy  sx*rxz  tx],
+             [sy*ryx  sy*ryy  sy*ryz  ty],
+             [sz*rzx  sz*rzy  sz*rzz  tz],
+             [     0       0       0   1]]
+
+    Inputs:
+
+    scales       - (..., 3) scale factors (sx, sy, sz)
+    rotations    - (..., 3) rotations (omega, phi, kappa) in degrees, see `rotation_matrices`
+    translations - (..., 3) translations (tx, ty, tz)
+
+    Returns:
+
+    An array of shape (..., 4, 4), broadcast over the leading dimensions of the inputs
+    """
+    scales = np.asarray(scales, dtype=np.float64)
+    rotations = np.asarray(rotations, dtype=np.float64)
+    translations = np.asarray(translations, dtype=np.float64)
+
+    SR = scales[..., :, np.newaxis] * rotation_matrices(
+        rotations[..., 0], rotations[..., 1], rotations[..., 2]
+    )
+    shape = np.broadcast_shapes(SR.shape[:-2], translations.shape[:-1])
+
+    Gamma = np.zeros(shape + (4, 4))
+    Gamma[..., 0:3, 0:3] = SR
+    Gamma[..., 0:3, 3] = translations
+    Gamma[..., 3, 3] = 1
+    return Gamma
+
+
+class HomogeneousTransform:
+    """
+    A scale, rotation and translation transform, or a stack of them, held as Gamma matrices of
+    shape (..., d + 1, d + 1). See `Transform2D` and `Transform3D`.
+
+    The Gamma matrices are built once, and then applied to whole arrays of points: an (N, d) array
+    of points is transformed with a single (N, d) @ (d, d) product plus the translation, rather
+    than point by point, and without first padding the points to homogeneous coordinates.
+    """
+
+    dimension = None
+
+    def __init__(self, Gamma):
+        """
+        Inputs:
+
+        Gamma - A (d + 1, d + 1) Gamma matrix, or a (..., d + 1, d + 1) stack of them
+        """
+        # A read-only copy, since the factors used by `apply` are derived from it and kept
+        self.Gamma = np.array(Gamma, dtype=np.float64)
+        self.Gamma.setflags(write=False)
+        size = self.dimension + 1
+        if self.Gamma.shape[-2:] != (size, size):
+            raise ValueError(f"Expected ({size}, {size}) Gamma matrices, got {self.Gamma.shape}.")
+        self._cast = {}
+
+    @property
+    def linear(self):
+        """
+        The scale and rotation part S @ R of the transform, of shape (..., d, d).
+        """
+        return self.Gamma[..., : self.dimension, : self.dimension]
+
+    @property
+    def translation(self):
+        """
+        The translation part of the transform, of shape (..., d).
+        """
+        return self.Gamma[..., : self.dimension, self.dimension]
+
+    def _factors(self, dtype):
+        # The transposed linear part and the translation, in the precision of the points. These
+        # are kept, so transforming batch after batch of points does not convert them every time.
+        if dtype not in self._cast:
+            self._cast[dtype] = (
+                np.ascontiguousarray(np.swapaxes(self.linear, -1, -2), dtype=dtype),
+                np.ascontiguousarray(self.translation[..., np.newaxis, :], dtype=dtype),
+            )
+        return self._cast[dtype]
+
+    def apply(self, points, out=None):
+        """
+        Transforms points from frame A into frame B.
+
+        Inputs:
+
+        points - An (N, d) array of points, or a (..., N, d) stack of them to transform with a
+                 stack of transforms. Floating point arrays keep their precision, e.g. float32
+                 LiDAR sweeps are transformed in float32.
+        out    - Optional preallocated output array, which may be `points` itself
+
+        Returns:
+
+        An array of the transformed points, with the shape of `points`
+        """
+        points = np.asarray(points)
+        dtype = points.dtype if np.issubdtype(points.dtype, np.floating) else np.dtype(np.float64)
+        (linear, translation) = self._factors(dtype)
+
+        if out is None:
+            out = points @ linear
+        elif out is points:
+            # Matrix multiplication cannot be done in place, so go through a temporary
+            out[...] = points @ linear
+        else:
+            np.matmul(points, linear, out=out)
+        out += translation
+        return out
+
+    def apply_to_poses(self, Gammas):
+        """
+        Re-expresses poses given in frame A in frame B.
+
+        Inputs:
+
+        Gammas - A (d + 1, d + 1) pose, or a (..., d + 1, d + 1) stack of them
+
+        Returns:
+
+        The transformed poses, as an array of the same shape
+        """
+        return self.Gamma @ np.asarray(Gammas)
+
+    def compose(self, other):
+        """
+        Composes two transforms, so that `self.compose(other).apply(p)` is equal to
+        `self.apply(other.apply(p))`.
+        """
+        return type(self)(self.Gamma @ other.Gamma)
+
+    def __matmul__(self, other):
+        return self.compose(other)
+
+    def inverse(self):
+        """
+        The transform from frame B back to frame A.
+        """
+        return type(self)(np.linalg.inv(self.Gamma))
+
+
+class Transform2D(HomogeneousTransform):
+    """
+    A 2D transform, or a stack of them, with the (3, 3) Gamma matrices of CoordinateFrames.py.
+    """
+
+    dimension = 2
+
+    @classmethod
+    def from_parameters(cls, scales=(1, 1), theta=0, translations=(0, 0)):
+        """
+        Builds the transform from scale factors, rotations in degrees and translations, see
+        `gamma_matrices_2d`.
+        """
+        return cls(gamma_matrices_2d(scales, theta, translations))
+
+
+class Transform3D(HomogeneousTransform):
+    """
+    A 3D transform, or a stack of them, with the (4, 4) Gamma matrices of CoordinateFrames3D.py.
+    """
+
+    dimension = 3
+
+    @classmethod
+    def from_parameters(cls, scales=(1, 1, 1), rotations=(0, 0, 0), translations=(0, 0, 0)):
+        """
+        Builds the transform from scale factors, rotations in degrees and translations, see
+        `gamma_matrices`.
+        """
+        return cls(gamma_matrices(scales, rotations, translations))
@@ -1,81 +1,468 @@
-from dataclasses import dataclass, field
+from array import array
+from dataclasses import dataclass, field, fields
 import datetime
-from random import randint, choice
-from typing import List, Any, Type, TypeVar
+import random
+from random import randint, randrange
+import sys
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TextIO,
+    Type,
+    TypeVar,
+)
 
 from faker import Faker
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-T = TypeVar("T", bound="DataGeneratorBase")
+
+T = TypeVar("T")
 fake = Faker()
 
 
-# This is a useful base class for tracking instances so we can use them in
-# relationships (picking a random artist or genre to foreign key to).
+class IdRegistry:
+    """
+    The database IDs of the rows of one table, so that other rows can pick random ones to
+    foreign key to.
+
+    Only the IDs are kept, in a typed array (4 bytes per ID) rather than a list of objects, and
+    picking one is O(1). With a capacity, the registry keeps a uniform random sample of at most
+    that many of the IDs it has seen (reservoir sampling), so memory stays bounded however many
+    rows are generated.
+    """
+
+    def __init__(self, capacity: Optional[int] = None, typecode: str = "i") -> None:
+        self.capacity = capacity
+        self.ids = array(typecode)
+        self.seen = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, id_: int) -> None:
+        self.seen += 1
+        if self.capacity is None or len(self.ids) < self.capacity:
+            self.ids.append(id_)
+        else:
+            # Keep each of the IDs seen so far with probability capacity / seen
+            slot = randrange(self.seen)
+            if slot < self.capacity:
+                self.ids[slot] = id_
+
+    def choice(self) -> int:
+        "Pick a random ID"
+        if not self.ids:
+            raise IndexError("Cannot choose from an empty registry")
+        return self.ids[randrange(len(self.ids))]
+
+    def sample(self, k: int) -> List[int]:
+        "Pick up to k distinct random IDs"
+        return [self.ids[i] for i in random.sample(range(len(self.ids)), min(k, len(self.ids)))]
+
+
+# This is a useful base class for tracking the IDs of the rows we created, so we
+# can use them in relationships (picking a random artist or genre to foreign key
+# to). The rows themselves are not kept, so they can be freed once inserted.
 class DataGeneratorBase:
-    def __new__(cls: Type[T], *args: Any, **kwargs: Any) -> T:
-        "Track class instances in a list on the class"
-        instance = super().__new__(cls, *args, **kwargs)  # type: ignore
-        if "instances" not in cls.__dict__:
-            cls.instances = []
-        cls.instances.append(instance)
-        return instance
+    __slots__ = ()
+    # Name of the primary key field, which register() sets
+    id_field: ClassVar[str]
+    registry: ClassVar[IdRegistry]
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        "Give every class its own registry"
+        super().__init_subclass__(**kwargs)
+        cls.registry = IdRegistry()
+
+    def register(self, id_: int) -> None:
+        "Set the database ID of this row, and track it in the registry of the class"
+        setattr(self, self.id_field, id_)
+        type(self).registry.add(id_)
+
+
+def reset_registries(capacity: Optional[int] = None) -> None:
+    "Forget every tracked ID, e.g. before generating a new data set"
+    for cls in (Genre, Artist, Album):
+        cls.registry = IdRegistry(capacity)
+
+
+def slotted_dataclass(cls: Type[T]) -> Type[T]:
+    """
+    dataclass(slots=True), which needs Python 3.10, for older Pythons as well. Instances of
+    slotted classes have no __dict__, which makes them smaller and faster to create.
+    """
+    if sys.version_info >= (3, 10):
+        return dataclass(slots=True)(cls)  # type: ignore
+
+    cls = dataclass(cls)
+    names = tuple(f.name for f in fields(cls))
+    namespace = {
+        key: value
+        for (key, value) in cls.__dict__.items()
+        if key not in names and key not in ("__dict__", "__weakref__")
+    }
+    namespace["__slots__"] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)  # type: ignore
+
+
+class ValuePool(Generic[T]):
+    """
+    Hands out fake values one at a time from batches generated ahead of time, so that generating
+    a row does not call into Faker for every field. Batches start small and double in size up to
+    size, so a few rows do not pay for a full pool.
+
+    When a pool runs out, the refresh policy decides what happens next:
+
+    - "regenerate" generates a new batch of values
+    - "reshuffle" hands out the same values again, in a new random order
+    - "reuse" hands out the same values again, in the same order
+    """
+
+    REFRESH_POLICIES = ("regenerate", "reshuffle", "reuse")
+
+    def __init__(
+        self,
+        generate: Callable[[int], List[T]],
+        size: int = 10000,
+        refresh: str = "regenerate",
+        initial_size: int = 64,
+    ) -> None:
+        if refresh not in self.REFRESH_POLICIES:
+            raise ValueError(f'Unknown refresh policy "{refresh}".')
+        self.generate = generate
+        self.size = size
+        self.refresh = refresh
+        self.initial_size = initial_size
+        self.reset()
+
+    def reset(self) -> None:
+        "Drop the pooled values, e.g. after reseeding Faker and random"
+        self.values: List[T] = []
+        self.cursor = 0
+        self.batch_size = min(self.initial_size, self.size)
+
+    def __call__(self) -> T:
+        if self.cursor == len(self.values):
+            self.refill()
+        value = self.values[self.cursor]
+        self.cursor += 1
+        return value
+
+    def refill(self) -> None:
+        if len(self.values) < self.size or self.refresh == "regenerate":
+            self.values = self.generate(self.batch_size)
+            self.batch_size = min(2 * self.batch_size, self.size)
+        elif self.refresh == "reshuffle":
+            random.shuffle(self.values)
+        self.cursor = 0
+
+
+def generate_street_names(count: int) -> List[str]:
+    return [fake.street_name() for _ in range(count)]
+
+
+def generate_names(count: int) -> List[str]:
+    return [fake.name() for _ in range(count)]
+
+
+def generate_titles(count: int) -> List[str]:
+    "Titles of 1 to 3 words, with the words of all titles drawn in a single Faker call"
+    lengths = [randint(1, 3) for _ in range(count)]
+    words = iter(fake.words(nb=sum(lengths)))
+    return [" ".join(next(words).title() for _ in range(length)) for length in lengths]
+
+
+def generate_dates(
+    count: int, earliest: datetime.date, latest: Optional[datetime.date] = None
+) -> List[datetime.date]:
+    "Dates between earliest and latest (defaults to today), drawn with NumPy when available"
+    (first, last) = (earliest.toordinal(), (latest or datetime.date.today()).toordinal())
+    if np is None:
+        return [datetime.date.fromordinal(randint(first, last)) for _ in range(count)]
+
+    # Seed NumPy from random, so that seeding random makes the dates reproducible as well
+    rng = np.random.default_rng(random.getrandbits(64))
+    days = (
+        rng.integers(first, last, size=count, endpoint=True) - datetime.date(1970, 1, 1).toordinal()
+    )
+    return days.astype("datetime64[D]").tolist()
+
+
+street_names: ValuePool[str] = ValuePool(generate_street_names)
+names: ValuePool[str] = ValuePool(generate_names)
+titles: ValuePool[str] = ValuePool(generate_titles)
+release_dates: ValuePool[datetime.date] = ValuePool(
+    lambda count: generate_dates(count, datetime.date(1970, 1, 1))
+)
+
+
+def configure_pools(
+    size: int = 10000, refresh: str = "regenerate", latest_release: Optional[datetime.date] = None
+) -> None:
+    "Replace the value pools the dataclasses draw from, see ValuePool"
+    global street_names, names, titles, release_dates
+    street_names = ValuePool(generate_street_names, size, refresh)
+    names = ValuePool(generate_names, size, refresh)
+    titles = ValuePool(generate_titles, size, refresh)
+    release_dates = ValuePool(
+        lambda count: generate_dates(count, datetime.date(1970, 1, 1), latest_release),
+        size,
+        refresh,
+    )
 
 
-@dataclass
+@slotted_dataclass
 class Genre(DataGeneratorBase):
+    id_field = "genre_id"
     genre_id: int = field(init=False)
-    name: str = field(default_factory=fake.street_name)
+    name: str = field(default_factory=lambda: street_names())
 
 
-@dataclass
+@slotted_dataclass
 class Artist(DataGeneratorBase):
+    id_field = "artist_id"
     artist_id: int = field(init=False)
-    name: str = field(default_factory=fake.name)
+    name: str = field(default_factory=lambda: names())
 
 
-@dataclass
+@slotted_dataclass
 class Album(DataGeneratorBase):
+    id_field = "album_id"
     album_id: int = field(init=False)
-    artist: Artist = field(default_factory=lambda: choice(Artist.instances))
-    title: str = field(
-        default_factory=lambda: " ".join(word.title() for word in fake.words(nb=randint(1, 3)))
-    )
-    released: datetime.date = field(default_factory=fake.date)
-    genres: List[Genre] = field(
-        # Use Faker to pick a list of genres to avoid duplicates
-        default_factory=lambda: fake.random_elements(
-            Genre.instances, length=randint(0, 3), unique=True
-        )
-    )
+    artist_id: int = field(default_factory=lambda: Artist.registry.choice())
+    title: str = field(default_factory=lambda: titles())
+    released: datetime.date = field(default_factory=lambda: release_dates())
+    # Distinct genres, to avoid duplicate album_genres rows
+    genre_ids: List[int] = field(default_factory=lambda: Genre.registry.sample(randint(0, 3)))
+
+
+class PlanCache:
+    "Prepare each query once, and reuse the plan for every later execution"
+
+    def __init__(self, plpy: Any) -> None:
+        self.plpy = plpy
+        self.plans: Dict[str, Any] = {}
+
+    def __call__(self, query: str, types: List[str]) -> Any:
+        if query not in self.plans:
+            self.plans[query] = self.plpy.prepare(query, types)
+        return self.plans[query]
 
 
 def main(plpy: Any) -> None:
+    plan = PlanCache(plpy)
     for _ in range(6):
         g = Genre()
         # "RETURNING id" lets us get the database-generated and store it on the
         # Python object for later reference without needing to issue additional
         # queries.
-        plan = plpy.prepare("INSERT INTO genres (name) VALUES ($1) RETURNING genre_id", ["text"])
-        g.genre_id = plan.execute([g.name])[0]["genre_id"]
+        result = plan("INSERT INTO genres (name) VALUES ($1) RETURNING genre_id", ["text"]).execute(
+            [g.name]
+        )
+        g.register(result[0]["genre_id"])
     for _ in range(6):
         artist = Artist()
-        plan = plpy.prepare("INSERT INTO artists (name) VALUES ($1) RETURNING artist_id", ["text"])
-        artist.artist_id = plan.execute([artist.name])[0]["artist_id"]
+        result = plan(
+            "INSERT INTO artists (name) VALUES ($1) RETURNING artist_id", ["text"]
+        ).execute([artist.name])
+        artist.register(result[0]["artist_id"])
     for _ in range(8):
         album = Album()
-        plan = plpy.prepare(
+        result = plan(
             "INSERT INTO albums (artist_id, title, released) VALUES ($1, $2, $3) RETURNING album_id",
             ["int", "text", "date"],
-        )
-        album.album_id = plan.execute([album.artist.artist_id, album.title, album.released])[0][
-            "album_id"
-        ]
+        ).execute([album.artist_id, album.title, album.released])
+        album.register(result[0]["album_id"])
 
         # Insert album_genres rows
-        for g in album.genres:
-            plan = plpy.prepare(
+        for genre_id in album.genre_ids:
+            plan(
                 "INSERT INTO album_genres (album_id, genre_id) VALUES ($1, $2)",
                 ["int", "int"],
+            ).execute([album.album_id, genre_id])
+
+
+def batches(count: int, batch_size: int) -> Iterator[int]:
+    "Split count into batch_size sized pieces"
+    for start in range(0, count, batch_size):
+        yield min(batch_size, count - start)
+
+
+# Multi-row inserts pass every column as an array and unnest them back into rows. The identity
+# values are assigned in insertion order, which "ORDER BY n" fixes to the order of the arrays, so
+# sorting the returned IDs lines them up with the rows that were sent.
+INSERT_GENRES = """
+    INSERT INTO genres (name)
+    SELECT name FROM unnest($1::text[]) WITH ORDINALITY AS rows (name, n) ORDER BY n
+    RETURNING genre_id
+"""
+INSERT_ARTISTS = """
+    INSERT INTO artists (name)
+    SELECT name FROM unnest($1::text[]) WITH ORDINALITY AS rows (name, n) ORDER BY n
+    RETURNING artist_id
+"""
+INSERT_ALBUMS = """
+    INSERT INTO albums (artist_id, title, released)
+    SELECT artist_id, title, released
+    FROM unnest($1::int[], $2::text[], $3::date[])
+        WITH ORDINALITY AS rows (artist_id, title, released, n)
+    ORDER BY n
+    RETURNING album_id
+"""
+INSERT_ALBUM_GENRES = """
+    INSERT INTO album_genres (album_id, genre_id)
+    SELECT * FROM unnest($1::int[], $2::int[])
+"""
+
+
+def returned_ids(result: Any, column: str) -> List[int]:
+    return sorted(row[column] for row in result)
+
+
+def main_bulk(
+    plpy: Any, genres: int = 6, artists: int = 6, albums: int = 8, batch_size: int = 1000
+) -> None:
+    """
+    Like main(), but sends batch_size rows per INSERT, through plans prepared once, so
+    seeding millions of rows takes thousands of round trips instead of millions.
+    """
+    plan = PlanCache(plpy)
+    for size in batches(genres, batch_size):
+        batch = [Genre() for _ in range(size)]
+        result = plan(INSERT_GENRES, ["text[]"]).execute([[g.name for g in batch]])
+        for (g, genre_id) in zip(batch, returned_ids(result, "genre_id")):
+            g.register(genre_id)
+    for size in batches(artists, batch_size):
+        batch = [Artist() for _ in range(size)]
+        result = plan(INSERT_ARTISTS, ["text[]"]).execute([[a.name for a in batch]])
+        for (artist, artist_id) in zip(batch, returned_ids(result, "artist_id")):
+            artist.register(artist_id)
+    for size in batches(albums, batch_size):
+        batch = [Album() for _ in range(size)]
+        result = plan(INSERT_ALBUMS, ["int[]", "text[]", "date[]"]).execute(
+            [
+                [album.artist_id for album in batch],
+                [album.title for album in batch],
+                [album.released for album in batch],
+            ]
+        )
+        for (album, album_id) in zip(batch, returned_ids(result, "album_id")):
+            album.register(album_id)
+
+        pairs = [(album.album_id, genre_id) for album in batch for genre_id in album.genre_ids]
+        if pairs:
+            plan(INSERT_ALBUM_GENRES, ["int[]", "int[]"]).execute(
+                [[album_id for (album_id, _) in pairs], [genre_id for (_, genre_id) in pairs]]
             )
-            plan.execute([album.album_id, g.genre_id])
+
+
+# Columns of every table, in the order of the CSV fixtures and COPY statements
+COLUMNS = {
+    "genres": ["genre_id", "name"],
+    "artists": ["artist_id", "name"],
+    "albums": ["album_id", "artist_id", "title", "released"],
+    "album_genres": ["album_id", "genre_id"],
+}
+
+
+def csv_field(value: Any) -> str:
+    "Format a value the way the CSV fixtures do: text quoted, numbers and dates bare"
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
+
+
+def csv_line(values: Sequence[Any]) -> str:
+    return ",".join(csv_field(value) for value in values) + "\n"
+
+
+def write_copy_batch(
+    stream: TextIO, table: str, columns: Sequence[str], rows: Iterable[Sequence[Any]]
+) -> None:
+    "Write rows as one COPY ... FROM stdin CSV block, as in add-data-copy-stdin.sql"
+    stream.write(f"COPY public.{table} ({', '.join(columns)}) FROM stdin CSV;\n")
+    for row in rows:
+        stream.write(csv_line(row))
+    # There MUST be a newline after the last "\.", otherwise it is read as a column value
+    stream.write("\\.\n\n")
+
+
+def write_copy_script(
+    stream: TextIO,
+    genres: int = 6,
+    artists: int = 6,
+    albums: int = 8,
+    batch_size: int = 10000,
+    registry_capacity: Optional[int] = None,
+) -> None:
+    """
+    Generate rows with IDs assigned here rather than by the database, and write them as a psql
+    script of COPY batches (load it with psql --file). Since no IDs come back from the database,
+    nothing needs to round trip, and COPY is the fastest way into PostgreSQL.
+
+    COPY writes the given IDs straight into the identity columns, so the script moves their
+    sequences past the loaded IDs afterwards.
+
+    The script starts from empty tables, so the registries are reset first (see
+    `reset_registries`), and albums only refer to the artists and genres written here.
+    """
+    reset_registries(registry_capacity)
+    stream.write("TRUNCATE albums, artists, genres, album_genres;\n\n")
+    next_id = 1
+    for size in batches(genres, batch_size):
+        batch = [Genre() for _ in range(size)]
+        for g in batch:
+            g.register(next_id)
+            next_id += 1
+        write_copy_batch(stream, "genres", COLUMNS["genres"], ((g.genre_id, g.name) for g in batch))
+    next_id = 1
+    for size in batches(artists, batch_size):
+        batch = [Artist() for _ in range(size)]
+        for artist in batch:
+            artist.register(next_id)
+            next_id += 1
+        write_copy_batch(
+            stream, "artists", COLUMNS["artists"], ((a.artist_id, a.name) for a in batch)
+        )
+    next_id = 1
+    for size in batches(albums, batch_size):
+        batch = [Album() for _ in range(size)]
+        for album in batch:
+            album.register(next_id)
+            next_id += 1
+        write_copy_batch(
+            stream,
+            "albums",
+            COLUMNS["albums"],
+            ((a.album_id, a.artist_id, a.title, a.released) for a in batch),
+        )
+        write_copy_batch(
+            stream,
+            "album_genres",
+            COLUMNS["album_genres"],
+            ((a.album_id, genre_id) for a in batch for genre_id in a.genre_ids),
+        )
+
+    for (table, column) in [
+        ("genres", "genre_id"),
+        ("artists", "artist_id"),
+        ("albums", "album_id"),
+    ]:
+        stream.write(
+            f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+            f"(SELECT coalesce(max({column}), 0) + 1 FROM {table}), false);\n"
+        )
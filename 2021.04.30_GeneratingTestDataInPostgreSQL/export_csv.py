@@ -0,0 +1,119 @@
+"""
+Stream generated test data into the CSV files loaded by the COPY scripts of
+2021.04.28_LoadingTestDataIntoPostgreSQL (genres.csv, artists.csv, albums.csv and
+album_genres.csv).
+
+IDs are assigned here, in order, rather than by the database, so no RETURNING round trip is
+needed to know them. Every row is written as soon as it is generated and then dropped; only the
+IDs are kept (see IdRegistry), so the files can grow far beyond memory.
+
+Usage:
+
+    python3 export_csv.py --albums 10000000 --artists 1000000 --genres 100 --gzip output/
+"""
+import argparse
+import gzip
+import os
+from types import TracebackType
+from typing import Dict, Optional, TextIO, Type
+
+from add_test_data import COLUMNS, Album, Artist, Genre, csv_line, reset_registries
+
+
+class CsvExporter:
+    "Writes Genre, Artist and Album rows to the four CSV files, one row at a time"
+
+    def __init__(
+        self,
+        directory: str,
+        compress: bool = False,
+        buffer_size: int = 1 << 20,
+        registry_capacity: Optional[int] = None,
+    ) -> None:
+        """
+        Open the four files in directory (as .csv.gz files if compress is set) and write their
+        headers. buffer_size is the number of bytes buffered per file before writing.
+
+        IDs start from 1 in every exporter, so the registries are reset (see `reset_registries`,
+        which registry_capacity is passed to), and albums only refer to artists and genres in
+        these files.
+        """
+        reset_registries(registry_capacity)
+        os.makedirs(directory, exist_ok=True)
+        self.files: Dict[str, TextIO] = {}
+        for (table, columns) in COLUMNS.items():
+            path = os.path.join(directory, f"{table}.csv")
+            if compress:
+                self.files[table] = gzip.open(path + ".gz", "wt", compresslevel=6, newline="")
+            else:
+                self.files[table] = open(path, "w", buffering=buffer_size, newline="")
+            self.files[table].write(",".join(columns) + "\n")
+        self.next_ids = {"genres": 1, "artists": 1, "albums": 1}
+
+    def _next_id(self, table: str) -> int:
+        id_ = self.next_ids[table]
+        self.next_ids[table] += 1
+        return id_
+
+    def add_genre(self, genre: Genre) -> None:
+        genre.register(self._next_id("genres"))
+        self.files["genres"].write(csv_line([genre.genre_id, genre.name]))
+
+    def add_artist(self, artist: Artist) -> None:
+        artist.register(self._next_id("artists"))
+        self.files["artists"].write(csv_line([artist.artist_id, artist.name]))
+
+    def add_album(self, album: Album) -> None:
+        "Write the album, and its album_genres rows"
+        album.register(self._next_id("albums"))
+        self.files["albums"].write(
+            csv_line([album.album_id, album.artist_id, album.title, album.released])
+        )
+        album_genres = self.files["album_genres"]
+        for genre_id in album.genre_ids:
+            album_genres.write(csv_line([album.album_id, genre_id]))
+
+    def write(self, genres: int = 6, artists: int = 6, albums: int = 8) -> None:
+        "Generate and write the given number of rows of each table"
+        for _ in range(genres):
+            self.add_genre(Genre())
+        for _ in range(artists):
+            self.add_artist(Artist())
+        for _ in range(albums):
+            self.add_album(Album())
+
+    def close(self) -> None:
+        for file in self.files.values():
+            file.close()
+
+    def __enter__(self) -> "CsvExporter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write test data CSV files for COPY.")
+    parser.add_argument("directory")
+    parser.add_argument("--genres", type=int, default=6)
+    parser.add_argument("--artists", type=int, default=6)
+    parser.add_argument("--albums", type=int, default=8)
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument(
+        "--registry-capacity",
+        type=int,
+        default=None,
+        help="only keep a random sample of this many IDs per table to pick foreign keys from",
+    )
+    args = parser.parse_args()
+
+    with CsvExporter(
+        args.directory, args.gzip, registry_capacity=args.registry_capacity
+    ) as exporter:
+        exporter.write(args.genres, args.artists, args.albums)
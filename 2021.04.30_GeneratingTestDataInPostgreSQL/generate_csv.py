@@ -0,0 +1,148 @@
+"""
+Generate large amounts of test data as CSV files for COPY, spread over a pool of processes.
+
+The rows of every table are split into shards of consecutive IDs. Each shard is generated by a
+worker whose Faker and random streams are seeded from (seed, table, shard), so the output only
+depends on the seed and the shard size, not on the number of processes or the order the shards
+finish in. The shards are then concatenated into genres.csv, artists.csv, albums.csv and
+album_genres.csv, in the format of the fixtures in 2021.04.28_LoadingTestDataIntoPostgreSQL, so
+that they load with its add-data-copy-*.sql scripts.
+
+Usage:
+
+    python3 generate_csv.py --albums 10000000 --artists 1000000 --genres 100 --seed 42 output/
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import datetime
+import os
+import random
+from random import randint
+import shutil
+from typing import Dict, List, Optional
+
+import add_test_data
+from add_test_data import COLUMNS, configure_pools, csv_line, fake
+
+
+# Release dates are drawn up to a fixed date rather than today, to keep the output reproducible
+LATEST_RELEASE = datetime.date(2021, 4, 30)
+
+
+@dataclass(frozen=True)
+class Shard:
+    table: str
+    index: int
+    # IDs start to stop - 1 of the table
+    start: int
+    stop: int
+
+
+def plan_shards(counts: Dict[str, int], shard_size: int) -> List[Shard]:
+    "Split the IDs of every table into shards of at most shard_size rows"
+    shards = []
+    for (table, count) in counts.items():
+        for (index, start) in enumerate(range(1, count + 1, shard_size)):
+            shards.append(Shard(table, index, start, min(start + shard_size, count + 1)))
+    return shards
+
+
+def shard_path(directory: str, table: str, index: int) -> str:
+    return os.path.join(directory, f"{table}.{index:06d}.csv")
+
+
+def write_shard(shard: Shard, counts: Dict[str, int], seed: int, directory: str) -> Shard:
+    "Generate the rows of one shard (album shards also write their album_genres rows)"
+    # Every shard gets its own stream, so it comes out the same whichever process runs it
+    shard_seed = f"{seed}:{shard.table}:{shard.index}"
+    fake.seed_instance(shard_seed)
+    random.seed(shard_seed)
+    # Fresh value pools, so no values carry over from a shard generated earlier in this process
+    configure_pools(latest_release=LATEST_RELEASE)
+
+    with open(shard_path(directory, shard.table, shard.index), "w") as rows:
+        if shard.table == "genres":
+            for genre_id in range(shard.start, shard.stop):
+                rows.write(csv_line([genre_id, add_test_data.street_names()]))
+        elif shard.table == "artists":
+            for artist_id in range(shard.start, shard.stop):
+                rows.write(csv_line([artist_id, add_test_data.names()]))
+        elif shard.table == "albums":
+            genre_ids = range(1, counts["genres"] + 1)
+            with open(shard_path(directory, "album_genres", shard.index), "w") as album_genres:
+                for album_id in range(shard.start, shard.stop):
+                    artist_id = randint(1, counts["artists"])
+                    (title, released) = (add_test_data.titles(), add_test_data.release_dates())
+                    rows.write(csv_line([album_id, artist_id, title, released]))
+                    for genre_id in random.sample(genre_ids, min(randint(0, 3), len(genre_ids))):
+                        album_genres.write(csv_line([album_id, genre_id]))
+        else:
+            raise ValueError(f'Unknown table "{shard.table}".')
+    return shard
+
+
+def merge_shards(directory: str, table: str, shards: int) -> str:
+    "Concatenate the shards of a table, in order, into one CSV file with a header"
+    path = os.path.join(directory, f"{table}.csv")
+    with open(path, "w") as merged:
+        merged.write(",".join(COLUMNS[table]) + "\n")
+        for index in range(shards):
+            with open(shard_path(directory, table, index)) as shard:
+                shutil.copyfileobj(shard, merged, 1 << 20)
+            os.remove(shard_path(directory, table, index))
+    return path
+
+
+def generate(
+    directory: str,
+    genres: int = 6,
+    artists: int = 6,
+    albums: int = 8,
+    seed: int = 0,
+    processes: Optional[int] = None,
+    shard_size: int = 100000,
+) -> List[str]:
+    """
+    Generate the four CSV files in directory, using processes worker processes (defaults to the
+    number of CPUs), and return their paths.
+    """
+    counts = {"genres": genres, "artists": artists, "albums": albums}
+    if albums > 0 and (genres < 1 or artists < 1):
+        raise ValueError("Albums need at least one artist and one genre to refer to.")
+    os.makedirs(directory, exist_ok=True)
+
+    shards = plan_shards(counts, shard_size)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(write_shard, shard, counts, seed, directory) for shard in shards]
+        for future in futures:
+            # Re-raise any error from the workers
+            future.result()
+
+    shard_counts = {table: 0 for table in COLUMNS}
+    for shard in shards:
+        shard_counts[shard.table] += 1
+    shard_counts["album_genres"] = shard_counts["albums"]
+    return [merge_shards(directory, table, shard_counts[table]) for table in COLUMNS]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate test data CSV files for COPY.")
+    parser.add_argument("directory")
+    parser.add_argument("--genres", type=int, default=6)
+    parser.add_argument("--artists", type=int, default=6)
+    parser.add_argument("--albums", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=100000)
+    args = parser.parse_args()
+
+    generate(
+        args.directory,
+        args.genres,
+        args.artists,
+        args.albums,
+        args.seed,
+        args.processes,
+        args.shard_size,
+    )
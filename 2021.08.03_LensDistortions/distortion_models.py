@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+# Models understood by `distort`, along with the parameters each of them reads from a distortions
+# dictionary and the value used when a parameter is left out.
+MODEL_PARAMETERS = {
+    "Brown-Conrady": {"k1": 0.0, "k2": 0.0, "p1": 0.0, "p2": 0.0},
+    "Kannala-Brandt": {"f": 1.0, "k1": 0.0, "k2": 0.0, "k3": 0.0, "k4": 0.0},
+}
+
+
+def model_parameters(distortions):
+    """
+    Reads the parameters for a distortion model out of a distortions dictionary, e.g.
+
+        {"kind": "Brown-Conrady", "k1": 4.9565e-2, "k2": 1.213e-5}
+
+    Any parameter that is not present in the dictionary takes its default value (zero for every
+    coefficient, one for the Kannala-Brandt `f`).
+
+    @param distortions - a dictionary holding the model "kind" and any of its parameters.
+
+    @returns (kind, params) - the model name and a dictionary with every parameter of that model.
+    """
+    kind = distortions["kind"]
+    if kind not in MODEL_PARAMETERS:
+        raise NotImplementedError(f'This script does not support the "{kind}" model.')
+
+    params = {
+        name: float(distortions.get(name, default))
+        for (name, default) in MODEL_PARAMETERS[kind].items()
+    }
+    return (kind, params)
+
+
+def as_float_array(values):
+    values = np.asarray(values)
+    if not np.issubdtype(values.dtype, np.floating):
+        values = values.astype(np.float64)
+    return values
+
+
+def brown_conrady(xs, ys, k1=0.0, k2=0.0, p1=0.0, p2=0.0):
+    """
+    Applies Brown-Conrady radial (k1, k2) and tangential (p1, p2) distortion to ideal image
+    coordinates:
+
+        r^2 = x^2 + y^2
+
+        dxr = x * (k1 * r^2 + k2 * r^4)
+        dyr = y * (k1 * r^2 + k2 * r^4)
+
+        dxt = p1 * (r^2 + 2 * x^2) + 2 * p2 * x * y
+        dyt = p2 * (r^2 + 2 * y^2) + 2 * p1 * x * y
+
+        (x_d, y_d) = (x - dxr - dxt, y - dyr - dyt)
+
+    `xs` and `ys` can be arrays of any (matching) shape. Every operation is done element-wise over
+    the whole array at once, and the floating point type of the inputs is preserved so that large
+    float32 grids stay float32.
+
+    @returns (distorted_xs, distorted_ys) - arrays with the same shape as `xs` and `ys`.
+    """
+    xs = as_float_array(xs)
+    ys = as_float_array(ys)
+
+    x2 = xs * xs
+    y2 = ys * ys
+    r2 = x2 + y2
+    two_xy = 2 * xs * ys
+
+    dr_over_r = r2 * (k1 + k2 * r2)
+
+    distorted_xs = xs - xs * dr_over_r - p1 * (r2 + 2 * x2) - p2 * two_xy
+    distorted_ys = ys - ys * dr_over_r - p2 * (r2 + 2 * y2) - p1 * two_xy
+
+    return (distorted_xs, distorted_ys)
+
+
+def kannala_brandt(xs, ys, f=1.0, k1=0.0, k2=0.0, k3=0.0, k4=0.0):
+    """
+    Applies the symmetric radial components of Kannala-Brandt distortion to ideal image
+    coordinates:
+
+        r = sqrt(x^2 + y^2)
+        theta = arctan(r / f)
+
+        dr = k1 * theta + k2 * theta^3 + k3 * theta^5 + k4 * theta^7
+
+        (x_d, y_d) = (x - x / r * dr, y - y / r * dr)
+
+    `xs` and `ys` can be arrays of any (matching) shape, see `brown_conrady`.
+
+    @returns (distorted_xs, distorted_ys) - arrays with the same shape as `xs` and `ys`.
+    """
+    xs = as_float_array(xs)
+    ys = as_float_array(ys)
+
+    r = np.hypot(xs, ys)
+    theta = np.arctan(r / f)
+    theta2 = theta * theta
+
+    dr = theta * (k1 + theta2 * (k2 + theta2 * (k3 + theta2 * k4)))
+
+    # If the radius is less than 1e-9 (some epsilon) we can say it is zero, so we just set that to
+    # 1.0 to avoid dividing by zero. This won't affect the math because if r ~= 0 then x and y (and
+    # dr) will be both zero.
+    r[r < 1e-9] = 1.0
+    dr_over_r = dr / r
+
+    return (xs - xs * dr_over_r, ys - ys * dr_over_r)
+
+
+def distort_mesh(xs, ys, distortions):
+    """
+    Applies the model described by `distortions` to a pair of coordinate arrays of any shape, e.g.
+    the output of `np.meshgrid`.
+
+    @param xs - x coordinates of the ideal points.
+    @param ys - y coordinates of the ideal points. Must have the same shape as `xs`.
+    @param distortions - a distortions dictionary, see `model_parameters`.
+
+    @returns (distorted_xs, distorted_ys) - arrays with the same shape as `xs` and `ys`.
+    """
+    (kind, params) = model_parameters(distortions)
+
+    if kind == "Brown-Conrady":
+        return brown_conrady(xs, ys, **params)
+    elif kind == "Kannala-Brandt":
+        return kannala_brandt(xs, ys, **params)
+
+
+def distort(points, distortions, out=None):
+    """
+    Applies the model described by `distortions` to an array of points in one vectorized pass.
+
+    @param points - an (N, 2) array of ideal (x, y) image coordinates.
+    @param distortions - a distortions dictionary, see `model_parameters`.
+    @param out - optional (N, 2) array to write the distorted points into.
+
+    @returns an (N, 2) array of distorted points (`out`, if it was provided).
+    """
+    points = as_float_array(points)
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError(f"Expected an (N, 2) array of points, got shape {points.shape}.")
+
+    (distorted_xs, distorted_ys) = distort_mesh(points[:, 0], points[:, 1], distortions)
+
+    if out is None:
+        out = np.empty_like(points)
+    out[:, 0] = distorted_xs
+    out[:, 1] = distorted_ys
+    return out
+
+
+def sensor_intrinsics(width, height, focal_length=None, principal_point=None):
+    """
+    Fills in the default focal length and principal point (both in pixels) for a `width` x `height`
+    sensor, see `pixel_grid`.
+
+    @returns (focal_length, (cx, cy))
+    """
+    if focal_length is None:
+        focal_length = max(width - 1, height - 1, 1) / 2
+    if principal_point is None:
+        principal_point = ((width - 1) / 2, (height - 1) / 2)
+    return (float(focal_length), tuple(float(c) for c in principal_point))
+
+
+def pixel_grid(width, height, focal_length=None, principal_point=None, dtype=np.float32):
+    """
+    Builds the ideal image-plane coordinates of every pixel on a `width` x `height` sensor:
+
+        x = (u - cx) / f
+        y = (v - cy) / f
+
+    By default the principal point (cx, cy) is the centre of the sensor and f is half of the
+    largest sensor dimension, so that the grid spans [-1, 1] along its longest side in the same way
+    as the plotting grid used for the blog figures.
+
+    @returns (xs, ys) - two (height, width) arrays of type `dtype`.
+    """
+    (focal_length, (cx, cy)) = sensor_intrinsics(width, height, focal_length, principal_point)
+
+    us = ((np.arange(width, dtype=np.float64) - cx) / focal_length).astype(dtype)
+    vs = ((np.arange(height, dtype=np.float64) - cy) / focal_length).astype(dtype)
+    return np.meshgrid(us, vs)
+
+
+def distort_grid(
+    width, height, distortions, focal_length=None, principal_point=None, dtype=np.float32
+):
+    """
+    Distorts the ideal coordinates of every pixel on a `width` x `height` sensor in one vectorized
+    pass, see `pixel_grid` for how pixels map onto the image plane.
+
+    @returns (distorted_xs, distorted_ys) - two (height, width) arrays of type `dtype`, in
+             image-plane units.
+    """
+    (xs, ys) = pixel_grid(width, height, focal_length, principal_point, dtype)
+    return distort_mesh(xs, ys, distortions)
+
+
+def _brown_conrady_point_jacobian(xs, ys, k1, k2, p1, p2):
+    r2 = xs * xs + ys * ys
+    dr_over_r = r2 * (k1 + k2 * r2)
+
+    # Derivative of dr_over_r with respect to x (and y), divided by x (and y)
+    ddr_over_r = 2 * (k1 + 2 * k2 * r2)
+
+    jacobian = np.empty(xs.shape + (2, 2), dtype=xs.dtype)
+    jacobian[..., 0, 0] = 1 - dr_over_r - xs * xs * ddr_over_r - 6 * p1 * xs - 2 * p2 * ys
+    jacobian[..., 0, 1] = -xs * ys * ddr_over_r - 2 * p1 * ys - 2 * p2 * xs
+    jacobian[..., 1, 0] = -xs * ys * ddr_over_r - 2 * p2 * xs - 2 * p1 * ys
+    jacobian[..., 1, 1] = 1 - dr_over_r - ys * ys * ddr_over_r - 6 * p2 * ys - 2 * p1 * xs
+    return jacobian
+
+
+def _kannala_brandt_point_jacobian(xs, ys, f, k1, k2, k3, k4):
+    r = np.hypot(xs, ys)
+    theta = np.arctan(r / f)
+    theta2 = theta * theta
+
+    dr = theta * (k1 + theta2 * (k2 + theta2 * (k3 + theta2 * k4)))
+    ddr_dtheta = k1 + theta2 * (3 * k2 + theta2 * (5 * k3 + theta2 * 7 * k4))
+    dtheta_dr = f / (f * f + r * r)
+
+    # Both dr / r and its derivative have finite limits at the centre of the image, so points
+    # within some epsilon of the centre use those limits instead of dividing by zero.
+    centre = r < 1e-9
+    r[centre] = 1.0
+
+    dr_over_r = dr / r
+    dr_over_r[centre] = k1 / f
+
+    # d(dr / r)/dr, divided by r so that it can be scaled by x * x, x * y and y * y directly
+    ddr_over_r = (ddr_dtheta * dtheta_dr * r - dr) / (r * r * r)
+    ddr_over_r[centre] = 0.0
+
+    jacobian = np.empty(xs.shape + (2, 2), dtype=xs.dtype)
+    jacobian[..., 0, 0] = 1 - dr_over_r - xs * xs * ddr_over_r
+    jacobian[..., 0, 1] = -xs * ys * ddr_over_r
+    jacobian[..., 1, 0] = jacobian[..., 0, 1]
+    jacobian[..., 1, 1] = 1 - dr_over_r - ys * ys * ddr_over_r
+    return jacobian
+
+
+def point_jacobian(xs, ys, distortions):
+    """
+    Computes the Jacobian of the distorted coordinates with respect to the ideal coordinates, i.e.
+
+        J = [[d(x_d)/dx  d(x_d)/dy]
+             [d(y_d)/dx  d(y_d)/dy]]
+
+    for every point at once.
+
+    @param xs - x coordinates of the ideal points, an array of any shape.
+    @param ys - y coordinates of the ideal points. Must have the same shape as `xs`.
+    @param distortions - a distortions dictionary, see `model_parameters`.
+
+    @returns an array of shape `xs.shape + (2, 2)`.
+    """
+    (kind, params) = model_parameters(distortions)
+    xs = as_float_array(xs)
+    ys = as_float_array(ys)
+
+    if kind == "Brown-Conrady":
+        return _brown_conrady_point_jacobian(xs, ys, **params)
+    elif kind == "Kannala-Brandt":
+        return _kannala_brandt_point_jacobian(xs, ys, **params)
+
+
+def _brown_conrady_parameter_jacobian(xs, ys, k1, k2, p1, p2):
+    r2 = xs * xs + ys * ys
+    two_xy = 2 * xs * ys
+
+    jacobian = np.empty(xs.shape + (2, 4), dtype=xs.dtype)
+    # k1
+    jacobian[..., 0, 0] = -xs * r2
+    jacobian[..., 1, 0] = -ys * r2
+    # k2
+    jacobian[..., 0, 1] = jacobian[..., 0, 0] * r2
+    jacobian[..., 1, 1] = jacobian[..., 1, 0] * r2
+    # p1
+    jacobian[..., 0, 2] = -(r2 + 2 * xs * xs)
+    jacobian[..., 1, 2] = -two_xy
+    # p2
+    jacobian[..., 0, 3] = -two_xy
+    jacobian[..., 1, 3] = -(r2 + 2 * ys * ys)
+    return jacobian
+
+
+def _kannala_brandt_parameter_jacobian(xs, ys, f, k1, k2, k3, k4):
+    r = np.hypot(xs, ys)
+    theta = np.arctan(r / f)
+    theta2 = theta * theta
+    ddr_dtheta = k1 + theta2 * (3 * k2 + theta2 * (5 * k3 + theta2 * 7 * k4))
+
+    # See `kannala_brandt` for why this is safe: x and y are zero wherever r is.
+    r_safe = r.copy()
+    r_safe[r_safe < 1e-9] = 1.0
+    x_over_r = xs / r_safe
+    y_over_r = ys / r_safe
+
+    jacobian = np.empty(xs.shape + (2, 5), dtype=xs.dtype)
+    # f, through theta: d(theta)/df = -r / (f^2 + r^2)
+    dr_df = -ddr_dtheta * r / (f * f + r * r)
+    jacobian[..., 0, 0] = -x_over_r * dr_df
+    jacobian[..., 1, 0] = -y_over_r * dr_df
+    # k1 through k4 multiply successive odd powers of theta
+    power = theta
+    for column in range(1, 5):
+        jacobian[..., 0, column] = -x_over_r * power
+        jacobian[..., 1, column] = -y_over_r * power
+        power = power * theta2
+    return jacobian
+
+
+def parameter_jacobian(points, distortions):
+    """
+    Computes the Jacobian of the distorted coordinates with respect to the parameters of the
+    distortion model, for every point at once:
+
+        Brown-Conrady:  columns are (k1, k2, p1, p2)
+        Kannala-Brandt: columns are (f, k1, k2, k3, k4)
+
+    i.e. the same order as `MODEL_PARAMETERS`. These are the closed-form derivatives of the
+    expressions in `brown_conrady` and `kannala_brandt`, so a calibration adjustment can build its
+    normal equations from them directly instead of finite differencing the model.
+
+    @param points - an (N, 2) array of ideal (x, y) image coordinates.
+    @param distortions - a distortions dictionary, see `model_parameters`.
+
+    @returns an (N, 2, P) array, where P is the number of parameters of the model.
+    """
+    (kind, params) = model_parameters(distortions)
+    points = as_float_array(points)
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError(f"Expected an (N, 2) array of points, got shape {points.shape}.")
+
+    if kind == "Brown-Conrady":
+        return _brown_conrady_parameter_jacobian(points[:, 0], points[:, 1], **params)
+    elif kind == "Kannala-Brandt":
+        return _kannala_brandt_parameter_jacobian(points[:, 0], points[:, 1], **params)
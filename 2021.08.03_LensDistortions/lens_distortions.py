@@ -5,6 +5,8 @@ import matplotlib.patches as mpatches
 import matplotlib.pyplot as plt
 import numpy as np
 
+from distortion_models import distort_mesh
+
 # Settings for grid display
 lower = -1
 upper = 1
@@ -42,65 +44,10 @@ class DistortionPlotter:
         self.ax.axis("equal")
 
     def add_distortion(self, distortions, color):
-        if distortions["kind"] == "Brown-Conrady":
-            k1 = distortions["k1"] if "k1" in distortions else 0.0
-            k2 = distortions["k2"] if "k2" in distortions else 0.0
-
-            p1 = distortions["p1"] if "p1" in distortions else 0.0
-            p2 = distortions["p2"] if "p2" in distortions else 0.0
-
-            r = self.xs ** 2 + self.ys ** 2
-
-            # We do this here so that we don't accidentally divide by zero if a point at the centre
-            # of our grid (i.e. (0, 0)) is part of our mesh grid set of xs and ys.
-            dr_over_r = k1 * r ** 2 + k2 * r ** 4
-
-            dxr = self.xs * dr_over_r
-            dyr = self.ys * dr_over_r
-
-            dxt = p1 * (self.ys ** 2 + 3 * xs ** 2) + 2 * p2 * xs * ys
-            dyt = p2 * (self.xs ** 2 + 3 * ys ** 2) + 2 * p1 * xs * ys
-
-            distorted_xs = self.xs - dxr - dxt
-            distorted_ys = self.ys - dyr - dyt
-
-            self.ax.plot(distorted_xs, distorted_ys, "-", color=color)
-            self.ax.plot(distorted_ys, distorted_xs, "-", color=color)
-        elif distortions["kind"] == "Kannala-Brandt":
-            # We only currently support the symmetric radial components of Kannala-Brandt
-            #
-            # The other terms are straightforward to add, but coming up with useful examples for the
-            # numbers to display can be difficult.
-            f = distortions["f"] if "f" in distortions else 1.0
-            k1 = distortions["k1"] if "k1" in distortions else 0.0
-            k2 = distortions["k2"] if "k2" in distortions else 0.0
-            k3 = distortions["k3"] if "k3" in distortions else 0.0
-            k4 = distortions["k4"] if "k4" in distortions else 0.0
-
-            r = self.xs ** 2 + self.ys ** 2
-
-            theta = np.arctan(r / f)
-
-            dr = k1 * theta + k2 * theta ** 3 + k3 * theta ** 5 + k4 * theta ** 7
-
-            # If the radius is less than 1e-9 (some epsilon) we can say it is zero, so we just set
-            # that to 1.0 to avoid dividing by zero in the subsequent computation for dxr and dyr
-            #
-            # This won't affect the math because if r ~= 0 then x and y will be both zero
-            r[r.abs() < 1e-9] = 1.0
-
-            dxr = self.xs / r * dr
-            dyr = self.ys / r * dr
-
-            distorted_xs = self.xs - dxr
-            distorted_ys = self.ys - dyr
+        (distorted_xs, distorted_ys) = distort_mesh(self.xs, self.ys, distortions)
 
-            self.ax.plot(distorted_xs, distorted_ys, "-", color=color)
-            self.ax.plot(distorted_ys, distorted_xs, "-", color=color)
-        else:
-            raise NotImplementedError(
-                f"This script does not support the \"{distortions['kind']}\" model."
-            )
+        self.ax.plot(distorted_xs, distorted_ys, "-", color=color)
+        self.ax.plot(distorted_ys, distorted_xs, "-", color=color)
 
         self.ax.axis("equal")
         pass
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from distortion_models import (
+    as_float_array,
+    distort_mesh,
+    model_parameters,
+    point_jacobian,
+    sensor_intrinsics,
+)
+
+
+def undistortion_map_key(width, height, distortions, focal_length=None, principal_point=None):
+    """
+    Builds a stable identifier for the undistortion map of a camera, from the distortion model, its
+    parameters, the sensor resolution and the intrinsics used to map pixels to the image plane.
+    Any change to one of those produces a different key, so stale maps are never picked up.
+    """
+    (kind, params) = model_parameters(distortions)
+    (focal_length, principal_point) = sensor_intrinsics(
+        width, height, focal_length, principal_point
+    )
+
+    description = json.dumps(
+        {
+            "kind": kind,
+            "params": params,
+            "width": int(width),
+            "height": int(height),
+            "focal_length": focal_length,
+            "principal_point": principal_point,
+        },
+        sort_keys=True,
+    )
+    digest = hashlib.sha1(description.encode("utf-8")).hexdigest()[:16]
+    return f"{kind}-{width}x{height}-{digest}"
+
+
+def _fill_undistortion_map(pixel_map, distortions, focal_length, principal_point, rows_per_chunk):
+    (height, width, _) = pixel_map.shape
+    (cx, cy) = principal_point
+
+    xs = ((np.arange(width, dtype=np.float64) - cx) / focal_length).astype(np.float32)
+
+    # Work through the sensor a block of rows at a time, so that building the map for a large
+    # sensor never needs more than a few rows worth of temporaries on top of the map itself.
+    for start in range(0, height, rows_per_chunk):
+        stop = min(start + rows_per_chunk, height)
+        ys = ((np.arange(start, stop, dtype=np.float64) - cy) / focal_length).astype(np.float32)
+
+        (mesh_xs, mesh_ys) = np.meshgrid(xs, ys)
+        (distorted_xs, distorted_ys) = distort_mesh(mesh_xs, mesh_ys, distortions)
+
+        pixel_map[start:stop, :, 0] = distorted_xs * focal_length + cx
+        pixel_map[start:stop, :, 1] = distorted_ys * focal_length + cy
+
+
+def undistortion_map(
+    width,
+    height,
+    distortions,
+    focal_length=None,
+    principal_point=None,
+    cache_dir=None,
+    rows_per_chunk=256,
+):
+    """
+    Computes the map used to rectify (undistort) images from a `width` x `height` sensor.
+
+    For every pixel (u, v) of the rectified image, the map holds the pixel coordinates in the raw
+    (distorted) image where that pixel's value should be read from. Those coordinates come from
+    running the ideal pixel position forward through the distortion model, so building the map
+    needs no iterative solve, and applying it (see `remap`) is a single gather per image.
+
+    If `cache_dir` is given, the map is stored there as a float32 `.npy` file named after
+    `undistortion_map_key`, and later calls with the same camera model memory-map that file
+    instead of recomputing it.
+
+    @param width, height - sensor resolution in pixels.
+    @param distortions - a distortions dictionary, see `distortion_models.model_parameters`.
+    @param focal_length, principal_point - intrinsics in pixels, see
+           `distortion_models.pixel_grid` for their defaults.
+    @param cache_dir - optional directory to cache maps in.
+    @param rows_per_chunk - number of sensor rows to compute at once.
+
+    @returns a (height, width, 2) float32 array (a read-only memory map when cached) of (u, v)
+             source pixel coordinates.
+    """
+    (focal_length, principal_point) = sensor_intrinsics(
+        width, height, focal_length, principal_point
+    )
+
+    if cache_dir is None:
+        pixel_map = np.empty((height, width, 2), dtype=np.float32)
+        _fill_undistortion_map(
+            pixel_map, distortions, focal_length, principal_point, rows_per_chunk
+        )
+        return pixel_map
+
+    key = undistortion_map_key(width, height, distortions, focal_length, principal_point)
+    path = os.path.join(cache_dir, f"{key}.npy")
+
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Write to a temporary file first and move it into place once it is complete, so that a
+        # concurrent (or interrupted) run never sees a partially written map.
+        (fd, tmp_path) = tempfile.mkstemp(suffix=".npy", dir=cache_dir)
+        os.close(fd)
+        try:
+            pixel_map = np.lib.format.open_memmap(
+                tmp_path, mode="w+", dtype=np.float32, shape=(height, width, 2)
+            )
+            _fill_undistortion_map(
+                pixel_map, distortions, focal_length, principal_point, rows_per_chunk
+            )
+            pixel_map.flush()
+            del pixel_map
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    return np.load(path, mmap_mode="r")
+
+
+def remap(image, pixel_map, interpolation="nearest", fill_value=0):
+    """
+    Rectifies `image` by sampling it at the source coordinates stored in `pixel_map`.
+
+    @param image - a (rows, cols) or (rows, cols, channels) array.
+    @param pixel_map - a (height, width, 2) array of (u, v) source coordinates, e.g. from
+           `undistortion_map`.
+    @param interpolation - "nearest" (a single gather) or "bilinear".
+    @param fill_value - value for output pixels whose source falls outside of `image`.
+
+    @returns a (height, width) or (height, width, channels) array with the dtype of `image`.
+    """
+    (rows, cols) = image.shape[:2]
+    us = pixel_map[..., 0]
+    vs = pixel_map[..., 1]
+
+    if interpolation == "nearest":
+        iu = np.rint(us).astype(np.intp)
+        iv = np.rint(vs).astype(np.intp)
+        valid = (iu >= 0) & (iu < cols) & (iv >= 0) & (iv < rows)
+
+        out = image[np.clip(iv, 0, rows - 1), np.clip(iu, 0, cols - 1)]
+    elif interpolation == "bilinear":
+        # Sources anywhere from the first to the last pixel centre are valid, including exactly
+        # on the last row or column, where du or dv reaches 1
+        valid = (us >= 0) & (us <= cols - 1) & (vs >= 0) & (vs <= rows - 1)
+
+        u0 = np.clip(np.floor(us), 0, max(cols - 2, 0)).astype(np.intp)
+        v0 = np.clip(np.floor(vs), 0, max(rows - 2, 0)).astype(np.intp)
+        # A single row or column has no neighbour to blend with
+        u1 = np.minimum(u0 + 1, cols - 1)
+        v1 = np.minimum(v0 + 1, rows - 1)
+        du = us - u0
+        dv = vs - v0
+        if image.ndim == 3:
+            du = du[..., np.newaxis]
+            dv = dv[..., np.newaxis]
+
+        top = image[v0, u0] * (1 - du) + image[v0, u1] * du
+        bottom = image[v1, u0] * (1 - du) + image[v1, u1] * du
+        out = top * (1 - dv) + bottom * dv
+        if np.issubdtype(image.dtype, np.integer):
+            out = np.rint(out)
+        out = out.astype(image.dtype)
+    else:
+        raise ValueError(f'Unknown interpolation "{interpolation}".')
+
+    out[~valid] = fill_value
+    return out
+
+
+def undistort(points, distortions, method="newton", max_iterations=20, tolerance=None):
+    """
+    Inverts the distortion model for every point in `points`, i.e. finds the ideal coordinates p
+    such that distort(p) lands on each observed (distorted) point.
+
+    Neither model has a closed-form inverse, so this iterates over the whole array at once. Two
+    update rules are available:
+
+        "fixed-point": p <- p + (observed - distort(p))
+        "newton":      p <- p - J(p)^-1 (distort(p) - observed)
+
+    where J is the 2x2 Jacobian from `distortion_models.point_jacobian`. Fixed-point steps are
+    cheaper, but Newton steps converge in far fewer iterations for strong distortions. Points whose
+    residual drops below `tolerance` are masked out, so later iterations only do work for the
+    points that are still converging.
+
+    @param points - an (N, 2) array of observed (distorted) image coordinates.
+    @param distortions - a distortions dictionary, see `distortion_models.model_parameters`.
+    @param method - "newton" or "fixed-point".
+    @param max_iterations - upper bound on the number of iterations for any point.
+    @param tolerance - the residual (in image-plane units) at which a point is considered solved.
+                       Defaults to 1e-10, or to a few units in the last place of the coordinates
+                       if that is larger (as it is for float32 points).
+
+    @returns (undistorted, iterations, residuals) - the (N, 2) ideal coordinates, the number of
+             iterations each point took, and the final residual norm for each point. Points with a
+             residual above `tolerance` did not converge within `max_iterations`.
+    """
+    if method not in ("newton", "fixed-point"):
+        raise ValueError(f'Unknown method "{method}".')
+
+    observed = as_float_array(points)
+    if observed.ndim != 2 or observed.shape[1] != 2:
+        raise ValueError(f"Expected an (N, 2) array of points, got shape {observed.shape}.")
+    if tolerance is None:
+        # float32 residuals cannot get anywhere near 1e-10, so scale with the precision instead
+        scale = max(1.0, float(np.abs(observed).max())) if len(observed) else 1.0
+        tolerance = max(1e-10, 8 * np.finfo(observed.dtype).eps * scale)
+
+    # The distorted point is the best initial guess we have, since both models are close to the
+    # identity near the centre of the image.
+    undistorted = observed.copy()
+    iterations = np.zeros(len(observed), dtype=np.int32)
+    residuals = np.full(len(observed), np.inf, dtype=observed.dtype)
+
+    active = np.arange(len(observed))
+    for iteration in range(max_iterations + 1):
+        xs = undistorted[active, 0]
+        ys = undistorted[active, 1]
+        (distorted_xs, distorted_ys) = distort_mesh(xs, ys, distortions)
+
+        errors = np.stack((distorted_xs, distorted_ys), axis=-1) - observed[active]
+        residuals[active] = np.hypot(errors[:, 0], errors[:, 1])
+
+        unconverged = residuals[active] > tolerance
+        active = active[unconverged]
+        if len(active) == 0 or iteration == max_iterations:
+            break
+        errors = errors[unconverged]
+        xs = xs[unconverged]
+        ys = ys[unconverged]
+
+        if method == "newton":
+            # Solve the 2x2 systems J @ step = errors directly, rather than through np.linalg,
+            # since the closed form is cheaper for this many tiny systems.
+            jacobian = point_jacobian(xs, ys, distortions)
+            (a, b) = (jacobian[:, 0, 0], jacobian[:, 0, 1])
+            (c, d) = (jacobian[:, 1, 0], jacobian[:, 1, 1])
+            determinant = a * d - b * c
+
+            undistorted[active, 0] -= (d * errors[:, 0] - b * errors[:, 1]) / determinant
+            undistorted[active, 1] -= (a * errors[:, 1] - c * errors[:, 0]) / determinant
+        else:
+            undistorted[active] -= errors
+
+        iterations[active] += 1
+
+    return (undistorted, iterations, residuals)
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+
+
+def _well_conditioned(N):
+    # Normal matrices that can be inverted without losing every significant digit, one flag per
+    # problem. Rank-deficient problems (e.g. every anchor at the same point) and problems whose
+    # model produced non-finite values are flagged, so they can be set aside rather than making
+    # the stacked solve raise for the whole batch.
+    if N.shape[0] == 0:
+        return np.ones(0, dtype=bool)
+    condition = np.linalg.cond(np.where(np.isfinite(N), N, 0.0))
+    limit = 1.0 / (N.shape[-1] * np.finfo(N.dtype).eps)
+    return np.isfinite(N).all(axis=(-2, -1)) & (condition < limit)
+
+
+def _solve(N, U):
+    # Stacked np.linalg.solve, with U kept as a stack of column vectors so that numpy never
+    # mistakes a (B, P) right-hand side for a single matrix. Problems with a singular N get NaN.
+    ok = _well_conditioned(N)
+    x = np.full(U.shape, np.nan)
+    x[ok] = np.linalg.solve(N[ok], U[ok][..., np.newaxis])[..., 0]
+    return (x, ok)
+
+
+def _inverse(N):
+    # Stacked np.linalg.inv, with NaN for the problems with a singular N
+    ok = _well_conditioned(N)
+    inverse = np.full(N.shape, np.nan)
+    inverse[ok] = np.linalg.inv(N[ok])
+    return (inverse, ok)
+
+
+def robust_weights(r, loss="linear", loss_scale=1.0):
+    """
+    Computes the iteratively reweighted least-squares (IRLS) weight of every observation from its
+    residual, for the robust losses supported by the adjustment solvers:
+
+        "linear": w = 1
+        "huber":  w = 1                  if |r| <= s
+                      s / |r|            otherwise
+        "cauchy": w = 1 / (1 + (r / s)^2)
+
+    where s is `loss_scale`, in the same units as the observations. Observations with residuals
+    well beyond s end up with little say in the solution, so a handful of outliers can no longer
+    drag the estimate away from the rest of the observations.
+
+    @returns an array of weights with the same shape as `r`.
+    """
+    if loss == "linear":
+        return np.ones_like(r)
+    elif loss == "huber":
+        magnitude = np.abs(r)
+        return loss_scale / np.maximum(magnitude, loss_scale)
+    elif loss == "cauchy":
+        scaled = r / loss_scale
+        return 1.0 / (1.0 + scaled * scaled)
+    else:
+        raise ValueError(f'Unknown loss "{loss}".')
+
+
+def gauss_newton(
+    model, x_initial, max_iterations=20, tolerance=1e-10, loss="linear", loss_scale=1.0
+):
+    """
+    Solves a batch of B independent non-linear least-squares problems at once, by iterating the
+    same Gauss-Newton step as `least_squares_solution_to_problem` (see
+    `projective_compensation.py`) until each problem converges:
+
+        N = J^T W J
+        U = J^T W G
+        delta = -N^-1 U
+        x = x + delta
+
+    Every step is a single stacked `np.linalg.solve` over all problems that have not converged yet,
+    so the cost of an iteration does not depend on how many Python calls the batch would otherwise
+    take. Problems stop iterating once the largest component of their correction is below
+    `tolerance`. A problem whose normal matrix is singular or too ill-conditioned to solve (e.g.
+    trilateration with every known point in the same place) is set aside with NaN estimates and
+    covariance, rather than stopping the rest of the batch.
+
+    W holds the weight of each observation. With the default "linear" loss every observation has
+    a weight of one; with a robust loss the weights are recomputed from the residuals at every
+    step (see `robust_weights`), which turns the iterations into iteratively reweighted least
+    squares over all observations at once.
+
+    @param model - a callable `model(x, active)` returning the tuple (g, j) for the problems whose
+           indices (into the batch) are in `active`, evaluated at their current estimates `x`:
+             - g, a (len(active), M) array of misclosures, i.e. f(x) - observations.
+             - j, a (len(active), M, P) array holding the Jacobian of f at x.
+    @param x_initial - a (B, P) array of initial estimates, one row per problem.
+    @param max_iterations - upper bound on the number of Gauss-Newton steps for any problem.
+    @param tolerance - size of the correction below which a problem is considered converged.
+    @param loss - "linear", "huber" or "cauchy", see `robust_weights`.
+    @param loss_scale - residual size at which a robust loss starts down-weighting observations.
+
+    @returns (x, r, covariance, iterations, converged)
+             - x, the (B, P) estimates, NaN for problems that could not be solved.
+             - r, the (B, M) residuals at those estimates.
+             - covariance, the (B, P, P) covariance of each estimate, i.e. N^-1 scaled by the a
+               posteriori variance factor r^T W r / (M - P).
+             - iterations, the number of steps each problem took.
+             - converged, a (B,) boolean array, False for problems that could not be solved or
+               did not converge within `max_iterations`.
+    """
+    x = np.array(x_initial, dtype=np.float64)
+    if x.ndim != 2:
+        raise ValueError(f"Expected a (B, P) array of initial estimates, got shape {x.shape}.")
+
+    iterations = np.zeros(len(x), dtype=np.int32)
+    converged = np.zeros(len(x), dtype=bool)
+    active = np.arange(len(x))
+    for _ in range(max_iterations):
+        (g, j) = model(x[active], active)
+        w = robust_weights(g, loss, loss_scale)
+
+        wj = w[..., np.newaxis] * j
+        N = np.swapaxes(j, 1, 2) @ wj
+        U = np.einsum("bmp,bm->bp", wj, g)
+
+        (delta, ok) = _solve(-N, U)
+        x[active] += delta
+        iterations[active] += 1
+
+        done = np.zeros(len(active), dtype=bool)
+        done[ok] = np.abs(delta[ok]).max(axis=1) <= tolerance
+        converged[active[done]] = True
+        active = active[ok & ~done]
+        if len(active) == 0:
+            break
+
+    everything = np.arange(len(x))
+    (r, j) = model(x, everything)
+    w = robust_weights(r, loss, loss_scale)
+    N = np.swapaxes(j, 1, 2) @ (w[..., np.newaxis] * j)
+
+    (m, p) = j.shape[1:]
+    redundancy = max(m - p, 1)
+    variance_factor = np.einsum("bm,bm,bm->b", r, w, r) / redundancy
+    (inverse, ok) = _inverse(N)
+    covariance = variance_factor[:, np.newaxis, np.newaxis] * inverse
+    converged &= ok
+
+    return (x, r, covariance, iterations, converged)
+
+
+def trilateration_model(d, ps):
+    """
+    Builds a `gauss_newton` model for a batch of trilateration problems, the generalization of the
+    problem described by the figures to any number of dimensions:
+
+        d = norm_2(p - q)
+
+    for unknown points q and known points p.
+
+    @param d - a (B, M) array of measured distances, M per problem.
+    @param ps - a (B, M, D) array of the known points that each distance was measured to.
+
+    @returns a callable suitable for `gauss_newton`, solving for (B, D) points q.
+    """
+    d = np.asarray(d, dtype=np.float64)
+    ps = np.asarray(ps, dtype=np.float64)
+
+    def model(q, active):
+        offsets = q[:, np.newaxis, :] - ps[active]
+        norms = np.linalg.norm(offsets, axis=2)
+
+        g = norms - d[active]
+        j = offsets / norms[..., np.newaxis]
+        return (g, j)
+
+    return model
+
+
+def _block_jacobi_preconditioner(N, block_size):
+    # Inverts each (block_size x block_size) block on the diagonal of N. For networks of points
+    # these blocks hold everything that ties the coordinates of a single point together, which
+    # makes their inverse a far better preconditioner than the plain diagonal.
+    n_blocks = N.shape[0] // block_size
+
+    coo = N.tocoo()
+    on_diagonal = coo.row // block_size == coo.col // block_size
+    blocks = np.zeros((n_blocks, block_size, block_size))
+    blocks[
+        coo.row[on_diagonal] // block_size,
+        coo.row[on_diagonal] % block_size,
+        coo.col[on_diagonal] % block_size,
+    ] = coo.data[on_diagonal]
+    inverse_blocks = np.linalg.inv(blocks)
+
+    def apply(v):
+        v = np.asarray(v).reshape((n_blocks, block_size))
+        return np.einsum("bij,bj->bi", inverse_blocks, v).ravel()
+
+    return scipy.sparse.linalg.LinearOperator(N.shape, matvec=apply, dtype=np.float64)
+
+
+def _conjugate_gradients(N, b, preconditioner, rtol, max_iterations):
+    try:
+        return scipy.sparse.linalg.cg(
+            N, b, rtol=rtol, atol=0.0, maxiter=max_iterations, M=preconditioner
+        )
+    except TypeError:
+        # SciPy before 1.12 calls the relative tolerance tol
+        return scipy.sparse.linalg.cg(
+            N, b, tol=rtol, atol=0.0, maxiter=max_iterations, M=preconditioner
+        )
+
+
+def sparse_gauss_newton(
+    model,
+    x_initial,
+    method="direct",
+    block_size=1,
+    max_iterations=20,
+    tolerance=1e-10,
+    loss="linear",
+    loss_scale=1.0,
+    cg_tolerance=None,
+    cg_max_iterations=None,
+):
+    """
+    Solves a single large least-squares problem (e.g. a whole network of points) with Gauss-Newton
+    steps, keeping both the Jacobian and the normal matrix as `scipy.sparse` matrices:
+
+        N = J^T W J
+        U = J^T W G
+        N delta = -U
+
+    Each observation in a network only touches a handful of unknowns, so J and N have a few
+    non-zero entries per row and memory grows with the number of observations, rather than with
+    the square of the number of unknowns as it does for the dense `gauss_newton`. Observation
+    weights W work the same way as they do for `gauss_newton`.
+
+    @param model - a callable `model(x)` returning the tuple (g, j) evaluated at the flat vector
+           of unknowns `x`:
+             - g, an (M,) array of misclosures, i.e. f(x) - observations.
+             - j, an (M, P) `scipy.sparse` matrix holding the Jacobian of f at x.
+    @param x_initial - a (P,) array with the initial estimate of every unknown.
+    @param method - how to solve the normal equations for each step:
+             - "direct", a sparse LU factorization of N.
+             - "cg", conjugate gradients, preconditioned with the inverse of the
+               (block_size x block_size) blocks on the diagonal of N.
+    @param block_size - number of consecutive unknowns that belong together (e.g. the D
+           coordinates of one point), used to precondition "cg".
+    @param max_iterations - upper bound on the number of Gauss-Newton steps.
+    @param tolerance - size of the correction below which the problem is considered converged.
+    @param loss - "linear", "huber" or "cauchy", see `robust_weights`.
+    @param loss_scale - residual size at which a robust loss starts down-weighting observations.
+    @param cg_tolerance - relative residual ||N delta + U|| / ||U|| at which "cg" stops each step.
+           Defaults to `tolerance`, so that the steps are solved at least as accurately as the
+           convergence test needs.
+    @param cg_max_iterations - upper bound on the conjugate gradient iterations of each step,
+           defaulting to 10 * P. A step that does not reach `cg_tolerance` within it raises
+           `np.linalg.LinAlgError`, rather than applying a partial step.
+
+    @returns (x, r, iterations) - the (P,) estimates, the (M,) residuals at those estimates, and the
+             number of steps taken.
+    """
+    if method not in ("direct", "cg"):
+        raise ValueError(f'Unknown method "{method}".')
+
+    x = np.array(x_initial, dtype=np.float64)
+    if len(x) % block_size != 0:
+        raise ValueError(f"{len(x)} unknowns cannot be split into blocks of {block_size}.")
+
+    iterations = 0
+    for _ in range(max_iterations):
+        (g, j) = model(x)
+
+        w = robust_weights(g, loss, loss_scale)
+
+        j = scipy.sparse.csr_matrix(j)
+        jTw = j.T @ scipy.sparse.diags(w)
+        N = (jTw @ j).tocsc()
+        U = jTw @ g
+
+        if method == "direct":
+            delta = scipy.sparse.linalg.spsolve(N, -U, permc_spec="MMD_AT_PLUS_A")
+        else:
+            preconditioner = _block_jacobi_preconditioner(N, block_size)
+            (delta, info) = _conjugate_gradients(
+                N,
+                -U,
+                preconditioner,
+                tolerance if cg_tolerance is None else cg_tolerance,
+                10 * len(x) if cg_max_iterations is None else cg_max_iterations,
+            )
+            if info < 0:
+                raise np.linalg.LinAlgError("Conjugate gradients broke down on the normal matrix.")
+            elif info > 0:
+                raise np.linalg.LinAlgError(
+                    f"Conjugate gradients did not converge within {info} iterations."
+                )
+
+        x += delta
+        iterations += 1
+
+        if np.abs(delta).max() <= tolerance:
+            break
+
+    (r, _) = model(x)
+    return (x, r, iterations)
+
+
+def network_trilateration_model(d, pairs, known_points, n_unknowns):
+    """
+    Builds a `sparse_gauss_newton` model for a trilateration network: distances measured between
+    pairs of points, where either end of each measurement can be an unknown point or a known one.
+
+    Points are referred to by index. Indices below `n_unknowns` are unknown points, in the same
+    order as the flattened vector of unknowns; index `n_unknowns + k` refers to `known_points[k]`.
+
+    @param d - an (M,) array of measured distances.
+    @param pairs - an (M, 2) array with the indices of the two points each distance was measured
+           between.
+    @param known_points - a (K, D) array of known points.
+    @param n_unknowns - the number of unknown points.
+
+    @returns a callable suitable for `sparse_gauss_newton`, solving for the (n_unknowns * D)
+             flattened coordinates of the unknown points. Use `block_size=D` when solving with
+             "cg".
+    """
+    d = np.asarray(d, dtype=np.float64)
+    pairs = np.asarray(pairs)
+    known_points = np.asarray(known_points, dtype=np.float64)
+    dimensions = known_points.shape[1]
+
+    (starts, ends) = (pairs[:, 0], pairs[:, 1])
+    rows = np.arange(len(d))
+
+    def model(x):
+        points = np.concatenate((x.reshape((-1, dimensions)), known_points))
+
+        offsets = points[starts] - points[ends]
+        norms = np.linalg.norm(offsets, axis=1)
+
+        g = norms - d
+        unit = offsets / norms[:, np.newaxis]
+
+        # Each observation has a derivative of +unit with respect to its start point and -unit with
+        # respect to its end point. Only ends that are unknowns get a column in J.
+        entries = []
+        for (ends_of_pair, sign) in ((starts, 1.0), (ends, -1.0)):
+            unknown = ends_of_pair < n_unknowns
+            for axis in range(dimensions):
+                entries.append(
+                    (
+                        rows[unknown],
+                        ends_of_pair[unknown] * dimensions + axis,
+                        sign * unit[unknown, axis],
+                    )
+                )
+
+        (j_rows, j_cols, j_values) = (np.concatenate(parts) for parts in zip(*entries))
+        j = scipy.sparse.csr_matrix(
+            (j_values, (j_rows, j_cols)), shape=(len(d), n_unknowns * dimensions)
+        )
+        return (g, j)
+
+    return model
+
+
+class IncrementalLeastSquares:
+    """
+    Solves a batch of B least-squares problems whose observations arrive over time, e.g. from a
+    live sensor feed, without re-solving from scratch for every new measurement.
+
+    Rather than keeping the observations around, this keeps the accumulated normal matrix N and
+    right-hand side b of every problem. Each new batch of k observations is linearized about the
+    latest estimate and folded in as a rank-k update:
+
+        N = N + J^T J
+        b = b - J^T G
+        x = x + N^-1 b
+
+    so the cost of an update depends only on the size of that batch (and on the small number of
+    unknowns P per problem), not on how many observations came before it. After each update the
+    problems are re-centred on the new estimate, which leaves b at zero until the next batch.
+    """
+
+    def __init__(self, x_initial):
+        """
+        @param x_initial - a (B, P) array of initial estimates, one row per problem.
+        """
+        self.x = np.array(x_initial, dtype=np.float64)
+        if self.x.ndim != 2:
+            raise ValueError(
+                f"Expected a (B, P) array of initial estimates, got shape {self.x.shape}."
+            )
+
+        (batch_size, p) = self.x.shape
+        self.N = np.zeros((batch_size, p, p))
+        self.b = np.zeros((batch_size, p))
+        # r^T r of every problem at its current estimate, for the a posteriori variance factor
+        self.residual_squares = np.zeros(batch_size)
+        self.observations = 0
+
+    def add_observations(self, model):
+        """
+        Folds a new batch of observations into every problem and updates the estimates.
+
+        @param model - a callable `model(x, active)` describing only the new observations, with the
+               same signature as the models used by `gauss_newton` (e.g. a `trilateration_model`
+               built from the new distances).
+
+        @returns the updated (B, P) estimates.
+        """
+        everything = np.arange(len(self.x))
+        (g, j) = model(self.x, everything)
+
+        self.N += np.swapaxes(j, 1, 2) @ j
+        self.b -= np.einsum("bmp,bm->bp", j, g)
+        self.residual_squares += np.einsum("bm,bm->b", g, g)
+        self.observations += g.shape[1]
+
+        # Until there are at least as many observations as unknowns, N is singular, so the
+        # estimates stay where they are and b keeps accumulating. The same goes for any problem
+        # whose observations so far leave N singular (e.g. all from the same point), without
+        # holding back the others.
+        if self.observations >= self.x.shape[1]:
+            (delta, ok) = _solve(self.N, self.b)
+            self.x[ok] += delta[ok]
+
+            # Re-centre on the new estimate: the minimum of the quadratic is r^T r - b^T delta,
+            # and the gradient there is zero.
+            self.residual_squares[ok] -= np.einsum("bp,bp->b", self.b[ok], delta[ok])
+            self.b[ok] = 0.0
+        return self.x
+
+    def covariance(self):
+        """
+        @returns the (B, P, P) covariance of the current estimates, i.e. N^-1 scaled by the a
+                 posteriori variance factor r^T r / (M - P), and NaN for problems whose N is
+                 still singular.
+        """
+        redundancy = max(self.observations - self.x.shape[1], 1)
+        variance_factor = np.maximum(self.residual_squares, 0.0) / redundancy
+        (inverse, _) = _inverse(self.N)
+        return variance_factor[:, np.newaxis, np.newaxis] * inverse
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Client-side version of the bench() function in scripts/clock_timestamp_function.sql.
+
+Like bench(), it runs a query 5 times to warm the cache, then times it for a number of
+iterations and reports avg/min/q1/median/q3/p95/max in milliseconds, with the percentiles
+interpolated the way percentile_cont does. Unlike bench(), the timings are taken by the client,
+around a round trip through a DB-API connection (including fetching the results), so they
+include the network and driver costs a real client pays. Several workers, each with their own
+connection, can run the query concurrently.
+
+Usage:
+
+    python3 bench.py --dsn "host=localhost user=postgres password=foo" \
+        --iterations 100 --workers 4 "SELECT * FROM artists"
+
+Connecting to PostgreSQL needs psycopg2. Without a database, --sqlite runs the same harness
+against an SQLite database file (or :memory:), which is handy for trying it out.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import math
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+WARMUP_ITERATIONS = 5
+PERCENTILES = {"q1": 0.25, "median": 0.5, "q3": 0.75, "p95": 0.95}
+
+
+def percentile_cont(sorted_values: Sequence[float], fraction: float) -> float:
+    """
+    The value at fraction (0 to 1) of the way through sorted_values, interpolating linearly
+    between the two nearest values, as PostgreSQL's percentile_cont(fraction) does.
+    """
+    if not sorted_values:
+        raise ValueError("Cannot take a percentile of no values.")
+    position = fraction * (len(sorted_values) - 1)
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return sorted_values[lower] + (position - lower) * (sorted_values[upper] - sorted_values[lower])
+
+
+def summarize(timings: Sequence[float]) -> Dict[str, float]:
+    "The avg/min/q1/median/q3/p95/max row bench() returns, for a list of timings"
+    ordered = sorted(timings)
+    summary = {"avg": sum(ordered) / len(ordered), "min": ordered[0]}
+    for (name, fraction) in PERCENTILES.items():
+        summary[name] = percentile_cont(ordered, fraction)
+    summary["max"] = ordered[-1]
+    return summary
+
+
+def run_query(cursor: Any, query: str, parameters: Optional[Sequence[Any]], fetch: bool) -> None:
+    if parameters is None:
+        cursor.execute(query)
+    else:
+        cursor.execute(query, parameters)
+    if fetch and cursor.description is not None:
+        cursor.fetchall()
+
+
+def run_worker(
+    connect: Callable[[], Any],
+    query: str,
+    iterations: int,
+    parameters: Optional[Sequence[Any]],
+    fetch: bool,
+    warmed_up: threading.Barrier,
+) -> List[float]:
+    "Warm up, wait for every other worker to warm up too, then time the query"
+    try:
+        connection = connect()
+        try:
+            cursor = connection.cursor()
+            for _ in range(WARMUP_ITERATIONS):
+                run_query(cursor, query, parameters, fetch)
+        except BaseException:
+            connection.close()
+            raise
+    except BaseException:
+        # Don't leave the other workers waiting at the barrier for this one
+        warmed_up.abort()
+        raise
+
+    try:
+        warmed_up.wait()
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter_ns()
+            run_query(cursor, query, parameters, fetch)
+            end = time.perf_counter_ns()
+            timings.append((end - start) / 1e6)
+        return timings
+    finally:
+        connection.close()
+
+
+def bench(
+    connect: Callable[[], Any],
+    query: str,
+    iterations: int = 100,
+    workers: int = 1,
+    parameters: Optional[Sequence[Any]] = None,
+    fetch: bool = True,
+) -> Dict[str, Any]:
+    """
+    Benchmark query from the client side.
+
+    connect is called once per worker, and must return a new DB-API connection (e.g.
+    lambda: psycopg2.connect(dsn), or lambda: sqlite3.connect(path, check_same_thread=False)).
+    Every worker warms the cache with 5 runs of the query, then runs it iterations times,
+    timing each run with a high-resolution timer around execute() and, if fetch is set,
+    fetchall(). Workers start timing together, once all of them are warmed up.
+
+    Returns a dictionary, ready to be written as JSON, with the summary of all timings in
+    milliseconds, the summary of each worker, and the throughput of all workers together.
+    """
+    # The clock starts when the last worker finishes warming up
+    started = []
+    warmed_up = threading.Barrier(workers, action=lambda: started.append(time.perf_counter()))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(run_worker, connect, query, iterations, parameters, fetch, warmed_up)
+            for _ in range(workers)
+        ]
+    # A worker that fails before the barrier breaks it for the others, so report its error
+    # rather than the BrokenBarrierError of whichever worker comes first
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    errors.sort(key=lambda error: isinstance(error, threading.BrokenBarrierError))
+    if errors:
+        raise errors[0]
+    per_worker = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started[0]
+
+    timings = [timing for worker_timings in per_worker for timing in worker_timings]
+    return {
+        "query": query,
+        "iterations": iterations,
+        "warmup_iterations": WARMUP_ITERATIONS,
+        "workers": workers,
+        "fetch": fetch,
+        "unit": "ms",
+        "summary": summarize(timings),
+        "workers_summary": [summarize(worker_timings) for worker_timings in per_worker],
+        "wall_time_s": elapsed,
+        "queries_per_second": len(timings) / elapsed,
+        "timings": timings,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark a query from the client side.")
+    parser.add_argument("query")
+    parser.add_argument("--dsn", help="libpq connection string, for PostgreSQL (needs psycopg2)")
+    parser.add_argument("--sqlite", help="SQLite database file (or :memory:) to use instead")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--no-fetch", action="store_true", help="don't fetch the results")
+    parser.add_argument("--timings", action="store_true", help="include every timing")
+    args = parser.parse_args()
+
+    if args.sqlite is not None:
+        connect = lambda: sqlite3.connect(args.sqlite, check_same_thread=False)
+    elif args.dsn is not None:
+        import psycopg2
+
+        connect = lambda: psycopg2.connect(args.dsn)
+    else:
+        parser.error("Either --dsn or --sqlite is required.")
+
+    results = bench(connect, args.query, args.iterations, args.workers, fetch=not args.no_fetch)
+    if not args.timings:
+        del results["timings"]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Parse the timings in data/ and compare the benchmarking methods side by side, with the same
+avg/min/q1/median/q3/p95/max summary as bench(), and the same bucketed histogram as
+histogram() in scripts/clock_timestamp_function_histogram.sql.
+
+The files come in four formats:
+
+- One timing per line: explain*.txt, log_duration*.txt, log_min_duration_statement*.txt,
+  psql_timings*.txt (milliseconds), log_statement_stats*.txt (seconds) and pg_bench*.txt
+  (microseconds).
+- The log_statement_stats*_raw.txt server logs, with a "s elapsed" line and a STATEMENT line per
+  query. Only the queries after the SELECT 'COUNT RESULTS AFTER THIS' marker of scripts/default.sql
+  are kept, which leaves out the warmup.
+- psql tables with one row of bench() results: clock_timestamp*.txt.
+- psql expanded records (\\x) of pg_stat_statements: pg_stat_statements*.txt. These only hold
+  the count, mean, min, max and standard deviation, so they have no percentiles or histogram.
+
+All timings are converted to milliseconds. Every file is read line by line, in a single pass,
+so large server logs never need to fit in memory.
+
+Usage:
+
+    python3 results.py data/
+    python3 results.py --histogram log_duration data/
+"""
+import argparse
+from array import array
+import fnmatch
+import json
+import math
+import os
+import random
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from bench import PERCENTILES, percentile_cont
+
+COLUMNS = ["avg", "min", "q1", "median", "q3", "p95", "max"]
+MARKER = "COUNT RESULTS AFTER THIS"
+ELAPSED = re.compile(r"([0-9.]+) s elapsed")
+
+
+class TimingStats:
+    """
+    Accumulates timings one at a time.
+
+    The count, average, min and max are always exact. The timings themselves are kept in a
+    compact array of doubles for the percentiles and the histogram, which are then exact too. If
+    max_samples is given, only a uniform random sample of that many timings is kept (reservoir
+    sampling), which bounds the memory used and makes the percentiles and histogram estimates.
+    """
+
+    def __init__(self, max_samples: Optional[int] = None) -> None:
+        self.max_samples = max_samples
+        self.samples = array("d")
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if self.max_samples is None or len(self.samples) < self.max_samples:
+            self.samples.append(value)
+        else:
+            index = random.randrange(self.count)
+            if index < self.max_samples:
+                self.samples[index] = value
+
+    def extend(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.add(value)
+
+    def summary(self) -> Dict[str, float]:
+        "The avg/min/q1/median/q3/p95/max row bench() returns"
+        if self.count == 0:
+            raise ValueError("No timings to summarize.")
+        ordered = sorted(self.samples)
+        summary = {"avg": self.total / self.count, "min": self.min}
+        for (name, fraction) in PERCENTILES.items():
+            summary[name] = percentile_cont(ordered, fraction)
+        summary["max"] = self.max
+        return summary
+
+    def histogram(self, buckets: int = 20) -> List[Tuple[int, float, float, int, str]]:
+        """
+        The rows of histogram(): (bucket, lowest, highest, freq, bar) for each non-empty bucket.
+
+        Like width_bucket(x, min, max, 20), the range from the smallest to the largest timing is
+        split into equal buckets numbered from 1, and the largest timing falls in bucket 21 of its
+        own. lowest and highest are the smallest and largest timings in the bucket (the numrange
+        column), and bar has (freq / (max(freq) + 1) * 15) stars, rounded like the ::int cast.
+        """
+        (low, high) = (min(self.samples), max(self.samples))
+        if low == high:
+            raise ValueError("Lower bound cannot equal upper bound.")
+        counts: Dict[int, Tuple[float, float, int]] = {}
+        for value in self.samples:
+            if value >= high:
+                bucket = buckets + 1
+            else:
+                bucket = int(buckets * ((value - low) / (high - low))) + 1
+            (lowest, highest, freq) = counts.get(bucket, (value, value, 0))
+            counts[bucket] = (min(lowest, value), max(highest, value), freq + 1)
+
+        max_freq = max(freq for (_, _, freq) in counts.values())
+        return [
+            (bucket, lowest, highest, freq, "*" * round(freq / (max_freq + 1) * 15))
+            for (bucket, (lowest, highest, freq)) in sorted(counts.items())
+        ]
+
+
+def read_values(lines: Iterable[str], scale: float = 1.0) -> Iterator[float]:
+    "Timings from one number per line, multiplied by scale"
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield float(line) * scale
+
+
+def read_statement_stats(lines: Iterable[str]) -> Iterator[Tuple[str, float]]:
+    "(statement, elapsed milliseconds) for each query in a log_statement_stats server log"
+    elapsed = None
+    for line in lines:
+        # Most lines are neither, so check cheaply before matching
+        if "elapsed" in line:
+            match = ELAPSED.search(line)
+            if match:
+                elapsed = float(match.group(1)) * 1000
+        elif "STATEMENT:" in line and elapsed is not None:
+            yield (line.split("STATEMENT:", 1)[1].strip(), elapsed)
+            elapsed = None
+
+
+def read_table(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    "The rows of psql's aligned table output, as dictionaries of column name to value"
+    columns = None
+    for line in lines:
+        if not line.strip() or line.startswith("(") or set(line.strip()) <= set("-+"):
+            continue
+        cells = [cell.strip() for cell in line.split("|")]
+        if columns is None:
+            columns = cells
+        else:
+            yield dict(zip(columns, cells))
+
+
+def read_records(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    "The records of psql's expanded output (-[ RECORD n ]---), as dictionaries of field to value"
+    record: Dict[str, str] = {}
+    for line in lines:
+        if line.startswith("-[ RECORD"):
+            if record:
+                yield record
+            record = {}
+        elif "|" in line:
+            (field, value) = line.split("|", 1)
+            record[field.strip()] = value.strip()
+    if record:
+        yield record
+
+
+class Method:
+    "The timings of one benchmarking method: their count, summary and, if known, the timings"
+
+    def __init__(
+        self,
+        count: Optional[int],
+        summary: Dict[str, Optional[float]],
+        stats: Optional[TimingStats] = None,
+    ) -> None:
+        self.count = count
+        self.summary = summary
+        self.stats = stats
+
+
+def load_values(file: TextIO, scale: float, max_samples: Optional[int]) -> Method:
+    stats = TimingStats(max_samples)
+    stats.extend(read_values(file, scale))
+    return Method(stats.count, stats.summary(), stats)
+
+
+def load_statement_stats(file: TextIO, max_samples: Optional[int]) -> Method:
+    "The queries after the last COUNT RESULTS AFTER THIS marker (or all of them), except SETs"
+    stats = TimingStats(max_samples)
+    for (statement, elapsed) in read_statement_stats(file):
+        if MARKER in statement:
+            # Everything before the marker was warmup
+            stats = TimingStats(max_samples)
+        elif not statement.upper().startswith("SET "):
+            stats.add(elapsed)
+    return Method(stats.count, stats.summary(), stats)
+
+
+def load_bench_table(file: TextIO, max_samples: Optional[int]) -> Method:
+    "The bench() results row; the number of timings is not in the output"
+    (row,) = read_table(file)
+    return Method(None, {column: float(row[column]) for column in COLUMNS})
+
+
+def load_pg_stat_statements(file: TextIO, max_samples: Optional[int]) -> Method:
+    "The record of the query called the most, which is the one benchmarked"
+    record = max(read_records(file), key=lambda record: int(record["calls"]))
+    summary: Dict[str, Optional[float]] = {column: None for column in COLUMNS}
+    for column in ["min", "max"]:
+        summary[column] = float(record[f"{column}_exec_time"])
+    summary["avg"] = float(record["mean_exec_time"])
+    return Method(int(record["calls"]), summary)
+
+
+# File name patterns and how to read them, the first match wins
+LOADERS: List[Tuple[str, Callable[[TextIO, Optional[int]], Method]]] = [
+    ("clock_timestamp*.txt", load_bench_table),
+    ("pg_stat_statements*.txt", load_pg_stat_statements),
+    ("log_statement_stats*_raw.txt", load_statement_stats),
+    ("log_statement_stats*.txt", lambda file, samples: load_values(file, 1000.0, samples)),
+    ("pg_bench*.txt", lambda file, samples: load_values(file, 0.001, samples)),
+    ("*.txt", lambda file, samples: load_values(file, 1.0, samples)),
+]
+
+
+def load(path: str, max_samples: Optional[int] = None) -> Method:
+    "Read a results file, in the format its name says it has"
+    name = os.path.basename(path)
+    for (pattern, loader) in LOADERS:
+        if fnmatch.fnmatch(name, pattern):
+            with open(path) as file:
+                return loader(file, max_samples)
+    raise ValueError(f'Unknown results file "{name}".')
+
+
+def load_directory(directory: str, max_samples: Optional[int] = None) -> Dict[str, Method]:
+    "Every results file in directory, by method name (the file name without .txt)"
+    return {
+        name[: -len(".txt")]: load(os.path.join(directory, name), max_samples)
+        for name in sorted(os.listdir(directory))
+        if name.endswith(".txt")
+    }
+
+
+def format_comparison(methods: Dict[str, Method]) -> str:
+    "A table of the summaries of the methods, one row each, in milliseconds"
+    header = ["method", "n"] + COLUMNS
+    rows = [header]
+    for (name, method) in methods.items():
+        cells = [name, "" if method.count is None else str(method.count)]
+        for column in COLUMNS:
+            value = method.summary[column]
+            cells.append("" if value is None else f"{value:.3f}")
+        rows.append(cells)
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = []
+    for (index, row) in enumerate(rows):
+        cells = [row[0].ljust(widths[0])] + [
+            cell.rjust(width) for (cell, width) in zip(row[1:], widths[1:])
+        ]
+        lines.append(" | ".join(cells))
+        if index == 0:
+            lines.append("-+-".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def format_histogram(stats: TimingStats, buckets: int = 20) -> str:
+    "The histogram, laid out like psql shows the result of histogram()"
+    lines = []
+    for (bucket, lowest, highest, freq, bar) in stats.histogram(buckets):
+        lines.append(f"{bucket:6d} | [{lowest:.3f},{highest:.3f}] | {freq:4d} | {bar}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the timings of benchmarking methods.")
+    parser.add_argument("directory", nargs="?", default="data")
+    parser.add_argument("--histogram", metavar="METHOD", help="show the histogram of one method")
+    parser.add_argument("--json", action="store_true", help="print the summaries as JSON")
+    parser.add_argument(
+        "--max-samples",
+        type=int,
+        default=None,
+        help="keep a random sample of this many timings per file for the percentiles",
+    )
+    args = parser.parse_args()
+
+    methods = load_directory(args.directory, args.max_samples)
+    if args.histogram is not None:
+        stats = methods[args.histogram].stats
+        if stats is None:
+            parser.error(f'The timings of "{args.histogram}" are not available.')
+        print(format_histogram(stats))
+    elif args.json:
+        summaries = {
+            name: dict(method.summary, n=method.count) for (name, method) in methods.items()
+        }
+        print(json.dumps(summaries, indent=2))
+    else:
+        print(format_comparison(methods))